@@ -1,3 +1,45 @@
 # flake8: noqa
 
-from canonicalwebteam.search.views import build_search_view, NoAPIKeyError
+from canonicalwebteam.search.views import (
+    build_search_view,
+    build_async_search_view,
+    build_search_api_view,
+    build_suggest_view,
+    NoAPIKeyError,
+)
+from canonicalwebteam.search.models import (
+    get_search_results,
+    async_get_search_results,
+)
+from canonicalwebteam.search.cache import (
+    SearchCache,
+    CacheBackend,
+    LRUCacheBackend,
+    FileSystemCacheBackend,
+    RedisCacheBackend,
+    PageCache,
+)
+from canonicalwebteam.search.singleflight import (
+    SingleFlight,
+    AsyncSingleFlight,
+    SingleFlightTimeout,
+)
+from canonicalwebteam.search.bots import BotMatcher
+from canonicalwebteam.search.rules import SearchRules, SearchRulesFile
+from canonicalwebteam.search.results import SearchResults, SearchResult
+from canonicalwebteam.search.session import SearchSession
+from canonicalwebteam.search.batch import (
+    BatchResult,
+    get_batch_search_results,
+    async_get_batch_search_results,
+    get_merged_search_results,
+    async_get_merged_search_results,
+    warm_search_cache,
+)
+from canonicalwebteam.search.fallback import (
+    LocalSearchIndex,
+    MappedSearchIndex,
+)
+from canonicalwebteam.search.budget import QuotaExceededError, QuotaTracker
+from canonicalwebteam.search.metrics import SearchMetrics, PrometheusMetrics
+from canonicalwebteam.search.suggest import QuerySuggestions
@@ -0,0 +1,404 @@
+# Standard library
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Packages
+import flask
+
+# Local
+from canonicalwebteam.search.jsonlib import loads
+from canonicalwebteam.search.models import (
+    async_get_search_results,
+    describe_error,
+    get_search_results,
+    prefetch_search_results,
+)
+from canonicalwebteam.search.normalize import (
+    DEFAULT_NUM,
+    DEFAULT_START,
+    normalize_search_params,
+)
+from canonicalwebteam.search.results import SearchResults
+
+logger = logging.getLogger(__name__)
+
+# The API returns at most 10 results per request,
+# and no results beyond the first 100
+MAX_NUM = 10
+MAX_RESULTS = 100
+
+
+class BatchResult:
+    """
+    The outcome of one search in a batch -
+    either its `results`, or the `error` it raised
+    """
+
+    __slots__ = ("results", "error")
+
+    def __init__(self, results=None, error=None):
+        self.results = results
+        self.error = error
+
+    def __repr__(self):
+        return f"BatchResult(results={self.results!r}, error={self.error!r})"
+
+
+def _build_search_kwargs(search, search_engine_id, site_restricted_search):
+    """
+    Turn a search spec into the keyword arguments for a search, e.g.:
+
+        {"query": "snap", "siteSearch": "snapcraft.io/docs"}
+
+    Specs may also set "start", "num", and their own "search_engine_id"
+    and "site_restricted_search".
+    """
+
+    return {
+        "search_engine_id": search.get("search_engine_id", search_engine_id),
+        "site_restricted_search": search.get(
+            "site_restricted_search", site_restricted_search
+        ),
+        **normalize_search_params(
+            search["query"],
+            start=search.get("start"),
+            num=search.get("num"),
+            siteSearch=search.get("siteSearch"),
+        ),
+    }
+
+
+def _get_user_agent(user_agent):
+    if user_agent is None and flask.has_request_context():
+        return str(flask.request.user_agent)
+
+    return user_agent or ""
+
+
+def get_batch_search_results(
+    session,
+    api_key,
+    searches,
+    search_engine_id,
+    site_restricted_search=False,
+    max_workers=4,
+    user_agent=None,
+    **options,
+):
+    """
+    Run several searches at once, e.g. across docs, blog and forum,
+    on up to `max_workers` threads, so they take as long as the slowest
+    rather than the sum of them all
+
+    `searches` is a list of specs, like {"query": "snap",
+    "siteSearch": "snapcraft.io/docs"}. Other keyword arguments, like
+    `cache`, are passed to `get_search_results` for every search.
+
+    Returns a `BatchResult` for each spec, in order.
+    """
+
+    user_agent = _get_user_agent(user_agent)
+
+    def search(spec):
+        try:
+            return BatchResult(
+                results=get_search_results(
+                    session=session,
+                    api_key=api_key,
+                    user_agent=user_agent,
+                    **_build_search_kwargs(
+                        spec, search_engine_id, site_restricted_search
+                    ),
+                    **options,
+                )
+            )
+        except Exception as error:
+            return BatchResult(error=error)
+
+    if not searches:
+        return []
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(searches)),
+        thread_name_prefix="search-batch",
+    ) as executor:
+        return list(executor.map(search, searches))
+
+
+async def async_get_batch_search_results(
+    client,
+    api_key,
+    searches,
+    search_engine_id,
+    site_restricted_search=False,
+    max_concurrency=10,
+    user_agent=None,
+    **options,
+):
+    """
+    The asyncio equivalent of `get_batch_search_results`, running up to
+    `max_concurrency` searches at once on an `httpx.AsyncClient`
+    """
+
+    user_agent = _get_user_agent(user_agent)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def search(spec):
+        async with semaphore:
+            try:
+                return BatchResult(
+                    results=await async_get_search_results(
+                        client=client,
+                        api_key=api_key,
+                        user_agent=user_agent,
+                        **_build_search_kwargs(
+                            spec, search_engine_id, site_restricted_search
+                        ),
+                        **options,
+                    )
+                )
+            except Exception as error:
+                return BatchResult(error=error)
+
+    return await asyncio.gather(*(search(spec) for spec in searches))
+
+
+def get_merged_search_results(
+    session,
+    api_key,
+    query,
+    search_engine_id,
+    site_restricted_search,
+    start=None,
+    num=None,
+    siteSearch=None,
+    max_workers=4,
+    user_agent=None,
+    **options,
+):
+    """
+    Get more than the API's limit of 10 results per request, by fetching
+    each page of up to 10 at once and merging them into one set of
+    results, without duplicate links
+
+    Paging information in "queries" describes the merged page, e.g.
+    "nextPage" starts after the last of the `num` results.
+
+    If any page fails, results up to that page are returned, or the
+    error is raised if the first page fails.
+    """
+
+    start, num, searches = _split_pages(query, start, num, siteSearch)
+
+    batch = get_batch_search_results(
+        session=session,
+        api_key=api_key,
+        searches=searches,
+        search_engine_id=search_engine_id,
+        site_restricted_search=site_restricted_search,
+        max_workers=max_workers,
+        user_agent=user_agent,
+        **options,
+    )
+
+    return _merge_pages(batch, start, num, options.get("compact"))
+
+
+async def async_get_merged_search_results(
+    client,
+    api_key,
+    query,
+    search_engine_id,
+    site_restricted_search,
+    start=None,
+    num=None,
+    siteSearch=None,
+    max_concurrency=10,
+    user_agent=None,
+    **options,
+):
+    """
+    The asyncio equivalent of `get_merged_search_results`
+    """
+
+    start, num, searches = _split_pages(query, start, num, siteSearch)
+
+    batch = await async_get_batch_search_results(
+        client=client,
+        api_key=api_key,
+        searches=searches,
+        search_engine_id=search_engine_id,
+        site_restricted_search=site_restricted_search,
+        max_concurrency=max_concurrency,
+        user_agent=user_agent,
+        **options,
+    )
+
+    return _merge_pages(batch, start, num, options.get("compact"))
+
+
+def _split_pages(query, start, num, siteSearch):
+    """
+    Split a search for `num` results from `start` into searches
+    for at most 10 results each
+    """
+
+    start = int(start or DEFAULT_START)
+    num = max(1, min(int(num or DEFAULT_NUM), MAX_RESULTS - start + 1))
+
+    searches = [
+        {
+            "query": query,
+            "siteSearch": siteSearch,
+            "start": page_start,
+            "num": min(MAX_NUM, start + num - page_start),
+        }
+        for page_start in range(start, start + num, MAX_NUM)
+    ]
+
+    return start, num, searches
+
+
+def _merge_pages(batch, start, num, compact):
+    """
+    Merge the results of each page in `batch`, up to the first error
+    """
+
+    if batch[0].error is not None:
+        raise batch[0].error
+
+    pages = []
+
+    for item in batch:
+        if item.error is not None:
+            break
+
+        results = item.results
+
+        if isinstance(results, SearchResults):
+            results = results.to_dict()
+
+        pages.append(results)
+
+    entries = []
+    links = set()
+
+    for page in pages:
+        for entry in page.get("entries", []):
+            link = entry.get("link")
+
+            if link in links:
+                continue
+
+            links.add(link)
+            entries.append(entry)
+
+    queries = {"request": [{"startIndex": start, "count": len(entries)}]}
+
+    if start > 1:
+        queries["previousPage"] = [
+            {"startIndex": max(1, start - num), "count": num}
+        ]
+
+    complete = len(pages) == len(batch)
+    has_next_page = "nextPage" in pages[-1].get("queries", {})
+
+    if complete and has_next_page and start + num <= MAX_RESULTS:
+        queries["nextPage"] = [{"startIndex": start + num, "count": num}]
+
+    merged_results = dict(pages[0], entries=entries, queries=queries)
+
+    if compact:
+        return SearchResults.from_dict(merged_results)
+
+    return merged_results
+
+
+def read_searches(path):
+    """
+    Read search specs from a file, with a query on each line,
+    or a JSON spec, like {"query": "snap", "siteSearch": "snapcraft.io"}
+    """
+
+    searches = []
+
+    with open(path, "rb") as searches_file:
+        for line in searches_file:
+            line = line.strip()
+
+            if line.startswith(b"{"):
+                searches.append(loads(line))
+            elif line:
+                searches.append({"query": line.decode("utf-8")})
+
+    return searches
+
+
+def warm_search_cache(
+    session,
+    api_key,
+    searches,
+    search_engine_id,
+    cache,
+    site_restricted_search=False,
+    max_workers=4,
+    budget=None,
+    **options,
+):
+    """
+    Fetch results for popular searches into the cache, e.g. after
+    a deploy, on up to `max_workers` threads
+
+    `searches` is a list of queries or specs, like {"query": "snap",
+    "siteSearch": "snapcraft.io/docs"}, or the path to a file of them
+    (see `read_searches`). Searches with fresh results in the cache are
+    skipped, and if provided, `budget` is called before each request,
+    which is skipped if it returns False.
+
+    Other keyword arguments, like `compact` and `timeout`, are passed
+    to `prefetch_search_results`.
+
+    Returns the number of searches fetched.
+    """
+
+    if isinstance(searches, (str, os.PathLike)):
+        searches = read_searches(searches)
+
+    def warm(search):
+        if isinstance(search, str):
+            search = {"query": search}
+
+        try:
+            return prefetch_search_results(
+                session=session,
+                api_key=api_key,
+                cache=cache,
+                budget=budget,
+                background=False,
+                **_build_search_kwargs(
+                    search, search_engine_id, site_restricted_search
+                ),
+                **options,
+            )
+        except Exception as error:
+            logger.warning(
+                f"Failed to warm search results for {search['query']!r}: "
+                f"{describe_error(error)}"
+            )
+
+            return False
+
+    if not searches:
+        return 0
+
+    with ThreadPoolExecutor(
+        max_workers=min(max_workers, len(searches)),
+        thread_name_prefix="search-warm",
+    ) as executor:
+        warmed = sum(executor.map(warm, searches))
+
+    logger.info(f"Warmed search results for {warmed} of {len(searches)}")
+
+    return warmed
@@ -0,0 +1,94 @@
+# Packages
+from limits import parse_many
+
+
+class CallBudget:
+    """
+    A budget for calls to the API, e.g. "500/day;50/hour", counted in
+    the storage of a `limits` rate limiter, such as Flask-Limiter's, so
+    it is shared between workers when the limiter's storage is
+    """
+
+    def __init__(self, limit, name):
+        self.limits = parse_many(limit)
+        self.name = name
+
+    def consume(self, rate_limiter):
+        """
+        Count one call against the budget, if it allows one more.
+        Returns whether it did.
+
+        Each limit is checked by hitting it, which is atomic, so
+        workers racing for the last call can't both get it. A call
+        turned away by a later limit is still counted against earlier
+        ones, so under contention the budget allows fewer calls,
+        never more.
+        """
+
+        identifiers = ("canonicalwebteam.search", self.name)
+
+        # Test first, so calls turned away aren't usually counted
+        for limit in self.limits:
+            if not rate_limiter.test(limit, *identifiers):
+                return False
+
+        for limit in self.limits:
+            if not rate_limiter.hit(limit, *identifiers):
+                return False
+
+        return True
+
+
+class QuotaExceededError(Exception):
+    """
+    Raised rather than calling the API once our quota is nearly used up
+    """
+
+
+class QuotaTracker:
+    """
+    Count every call made to the API against our quota, e.g. Google's
+    "10000/day", in the storage of a `limits` rate limiter, so it is
+    counted across all workers when the limiter's storage is shared.
+
+    Once `threshold` of any limit is used, `is_exhausted` is True, so
+    searches can be served from the cache or a local index instead.
+    """
+
+    def __init__(self, limit, threshold=0.9, name="upstream"):
+        self.limits = parse_many(limit)
+        self.threshold = threshold
+        self.name = name
+
+    def record(self, rate_limiter):
+        """
+        Count one call to the API
+        """
+
+        for limit in self.limits:
+            rate_limiter.hit(limit, "canonicalwebteam.search", self.name)
+
+    def usage(self, rate_limiter):
+        """
+        Return the number of calls counted against each limit
+        """
+
+        return {
+            str(limit): limit.amount
+            - rate_limiter.get_window_stats(
+                limit, "canonicalwebteam.search", self.name
+            ).remaining
+            for limit in self.limits
+        }
+
+    def is_exhausted(self, rate_limiter):
+        """
+        Whether calls have reached `threshold` of any limit
+        """
+
+        usage = self.usage(rate_limiter)
+
+        return any(
+            usage[str(limit)] >= self.threshold * limit.amount
+            for limit in self.limits
+        )
@@ -0,0 +1,364 @@
+# Standard library
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+# Local
+from canonicalwebteam.search.jsonlib import dumps, loads
+
+
+def build_cache_key(url_endpoint, params, prefix="canonicalwebteam.search"):
+    """
+    Build a stable cache key from the endpoint and the query parameters
+    sent to the Google Custom Search API.
+
+    The API key is never part of the key, and unset parameters are
+    dropped, in the same way `requests` drops them from the URL.
+    """
+
+    items = sorted(
+        (name, str(value))
+        for name, value in params.items()
+        if name != "key" and value is not None
+    )
+
+    return f"{prefix}:{url_endpoint}?{urlencode(items)}"
+
+
+class CacheBackend:
+    """
+    Interface for the storage used by SearchCache.
+
+    Backends only need to store and return values with an expiry,
+    SearchCache takes care of freshness and hit/miss accounting.
+    """
+
+    def get(self, key):
+        """
+        Return the value stored for `key`, or None if missing or expired
+        """
+
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """
+        Store `value` for `key` for `ttl` seconds
+        """
+
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Remove `key` from the store, if it is there
+        """
+
+        raise NotImplementedError
+
+
+class LRUCacheBackend(CacheBackend):
+    """
+    A bounded in-process cache, evicting the least recently used
+    entries once `max_entries` is reached
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            expires, value = entry
+
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class FileSystemCacheBackend(CacheBackend):
+    """
+    Store entries as JSON files in a directory, so they can be shared
+    between worker processes on the same machine
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        filename = hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+        return os.path.join(self.directory, f"{filename}.json")
+
+    def get(self, key):
+        path = self._path(key)
+
+        try:
+            with open(path, "rb") as cache_file:
+                entry = loads(cache_file.read())
+        except (OSError, ValueError):
+            return None
+
+        if entry["expires"] <= time.time():
+            self.delete(key)
+            return None
+
+        return entry["value"]
+
+    def set(self, key, value, ttl):
+        entry = dumps({"expires": time.time() + ttl, "value": value})
+
+        # Write to a temporary file first so readers never see
+        # a partially written entry
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory)
+
+        with os.fdopen(file_descriptor, "wb") as cache_file:
+            cache_file.write(entry)
+
+        os.replace(temporary_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Store entries in Redis, or anything with a Redis-compatible
+    `get`, `set(..., ex=ttl)` and `delete` interface, e.g.:
+
+        import redis
+
+        backend = RedisCacheBackend(redis.Redis.from_url(redis_url))
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+
+        if value is None:
+            return None
+
+        return loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+
+class SearchCache:
+    """
+    Cache search results for `ttl` seconds in the given backend,
+    counting hits and misses so we can see how much quota it saves.
+
+    Entries are kept for a further `stale_ttl` seconds after they
+    expire, so they can still be served while being refreshed, or
+    when the API is failing.
+
+    Defaults to a bounded in-process LRU cache:
+
+        cache = SearchCache(ttl=600)
+        cache = SearchCache(RedisCacheBackend(client), ttl=600)
+    """
+
+    def __init__(self, backend=None, ttl=300, stale_ttl=0):
+        self.backend = backend if backend is not None else LRUCacheBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, key):
+        """
+        Return a tuple of the results stored for `key` and whether they
+        are stale, or (None, False) if there is nothing stored.
+
+        Stale results count as misses, as they still need refreshing.
+        """
+
+        entry = self.backend.get(key)
+        results = None
+        stale = False
+
+        if entry is not None:
+            results = entry["results"]
+            stale = entry["stored_at"] + self.ttl <= time.time()
+
+        with self._lock:
+            if results is None or stale:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return results, stale
+
+    def get(self, key):
+        """
+        Return the fresh results stored for `key`, or None
+        """
+
+        results, stale = self.lookup(key)
+
+        return None if stale else results
+
+    def is_fresh(self, key):
+        """
+        Whether there are fresh results for `key`,
+        without counting it as a hit or miss
+        """
+
+        entry = self.backend.get(key)
+
+        return (
+            entry is not None and entry["stored_at"] + self.ttl > time.time()
+        )
+
+    def set(self, key, results):
+        entry = {"results": results, "stored_at": time.time()}
+
+        self.backend.set(key, entry, self.ttl + self.stale_ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def record_stale_hit(self):
+        """
+        Count stale results that were served in place of fresh ones
+        """
+
+        with self._lock:
+            self.stale_hits += 1
+
+    def stats(self):
+        """
+        Return hit, stale hit and miss counts,
+        plus the ratio of hits to lookups
+        """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class PageCache:
+    """
+    Keep rendered pages in process, up to `max_bytes` of them in total,
+    evicting the least recently used first, e.g.:
+
+        build_search_view(app, cache=cache, page_cache=PageCache())
+
+    Pages larger than `max_bytes` aren't kept at all.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, key):
+        """
+        Return the encoded page stored for `key`, or None
+        """
+
+        with self._lock:
+            page = self._pages.get(key)
+
+            if page is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._pages.move_to_end(key)
+
+            return page
+
+    def set(self, key, page):
+        """
+        Store `page`, encoding it if it's a string, and return it encoded
+        """
+
+        if isinstance(page, str):
+            page = page.encode("utf-8")
+
+        if len(page) > self.max_bytes:
+            return page
+
+        with self._lock:
+            previous = self._pages.pop(key, None)
+
+            if previous is not None:
+                self.size -= len(previous)
+
+            self._pages[key] = page
+            self.size += len(page)
+
+            while self.size > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.size -= len(evicted)
+
+        return page
+
+    def stats(self):
+        """
+        Return hit and miss counts, the ratio of hits to lookups,
+        and the number and total size of pages kept
+        """
+
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "pages": len(self._pages),
+                "bytes": self.size,
+            }
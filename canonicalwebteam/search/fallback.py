@@ -0,0 +1,553 @@
+# Standard library
+import bisect
+import html
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+from array import array
+
+# Local
+from canonicalwebteam.search.jsonlib import dumps, loads
+from canonicalwebteam.search.normalize import normalize_query
+from canonicalwebteam.search.results import ENTRY_FIELDS, SearchResults
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Title words count this many times over snippet or body words
+TITLE_WEIGHT = 2
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# The on-disk index format, see write_index
+INDEX_MAGIC = b"CWSIDX01"
+INDEX_HEADER = struct.Struct("<8sIId8Q")
+TERM_RECORD = struct.Struct("<QIQI")
+POSTING = struct.Struct("<II")
+
+
+def tokenize(text):
+    """
+    Split text, which may contain HTML, into normalized words
+    """
+
+    text = html.unescape(TAG_PATTERN.sub(" ", text or ""))
+
+    return TOKEN_PATTERN.findall(normalize_query(text))
+
+
+def count_terms(title, body):
+    """
+    Return the weighted count of each word in a document, and its length
+    """
+
+    term_counts = {}
+    title_tokens = tokenize(title)
+    body_tokens = tokenize(body)
+
+    for token in title_tokens:
+        term_counts[token] = term_counts.get(token, 0) + TITLE_WEIGHT
+
+    for token in body_tokens:
+        term_counts[token] = term_counts.get(token, 0) + 1
+
+    length = TITLE_WEIGHT * len(title_tokens) + len(body_tokens)
+
+    return term_counts, length
+
+
+def bm25(term_frequency, document_frequency, length, average_length, total):
+    """
+    Score a term in a document with Okapi BM25
+    (k1 = 1.2, b = 0.75)
+    """
+
+    idf = math.log(
+        1 + (total - document_frequency + 0.5) / (document_frequency + 0.5)
+    )
+    normalized_length = 0.25 + 0.75 * length / (average_length or 1)
+
+    return (
+        idf * term_frequency * 2.2 / (term_frequency + 1.2 * normalized_length)
+    )
+
+
+def matches_site(link, site):
+    """
+    Whether `link` is on `site`, a domain with an optional path as in
+    the API's siteSearch, including its subdomains
+    """
+
+    host, _, path = re.sub(r"^\w+://", "", site).strip("/").partition("/")
+    link_host, _, link_path = re.sub(r"^\w+://", "", link).partition("/")
+
+    if link_host != host and not link_host.endswith(f".{host}"):
+        return False
+
+    return link_path.startswith(path)
+
+
+def build_results(entries, total, start, num):
+    """
+    Shape a page of local results like results from the API
+    """
+
+    queries = {"request": [{"startIndex": start, "count": len(entries)}]}
+
+    if start > 1:
+        queries["previousPage"] = [
+            {"startIndex": max(1, start - num), "count": num}
+        ]
+
+    if start + num <= total:
+        queries["nextPage"] = [{"startIndex": start + num, "count": num}]
+
+    return {
+        "entries": entries,
+        "queries": queries,
+        "searchInformation": {
+            "totalResults": str(total),
+            "formattedTotalResults": f"{total:,}",
+        },
+    }
+
+
+def build_entry(link, title, snippet="", **fields):
+    """
+    Build a result entry with the fields templates use from the API,
+    escaping plain text into the "html" fields
+    """
+
+    entry = {
+        "title": title,
+        "htmlTitle": html.escape(title),
+        "link": link,
+        "displayLink": re.sub(r"^\w+://", "", link).split("/")[0],
+        "htmlSnippet": html.escape(snippet),
+        "formattedUrl": link,
+        "htmlFormattedUrl": html.escape(link),
+    }
+    entry.update(
+        (field, value) for field, value in fields.items() if field in entry
+    )
+
+    return entry
+
+
+class LocalSearchIndex:
+    """
+    An in-memory full text index of documents, ranked with BM25, to
+    fall back on when we can't search with the API.
+
+    Build it from documents at startup, e.g. from a JSON lines dump, or
+    leave `learn` on to add every result the API returns, up to
+    `max_documents`.
+    """
+
+    def __init__(self, documents=(), learn=True, max_documents=10000):
+        self.learn = learn
+        self.max_documents = max_documents
+        self.entries = []
+        self.lengths = array("I")
+        # Each term maps to parallel arrays of document ids and counts
+        self.postings = {}
+        self.links = set()
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+        for document in documents:
+            self.add_document(**document)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def from_jsonl(cls, path, **kwargs):
+        """
+        Load documents from a file with a JSON object on each line, with
+        at least "link" and "title", and optionally "snippet" and "body"
+        """
+
+        with open(path, "rb") as jsonl_file:
+            documents = [loads(line) for line in jsonl_file if line.strip()]
+
+        return cls(documents, **kwargs)
+
+    def add_document(self, link, title, snippet="", body=None, **fields):
+        """
+        Add a document, unless one with the same link is indexed.
+        `body` defaults to the snippet.
+        """
+
+        # Check before the work of tokenizing, as most results we
+        # learn from will already be indexed
+        if link in self.links:
+            return False
+
+        term_counts, length = count_terms(
+            title, snippet if body is None else body
+        )
+
+        with self._lock:
+            if link in self.links or len(self.entries) >= self.max_documents:
+                return False
+
+            document_id = len(self.entries)
+
+            self.entries.append(build_entry(link, title, snippet, **fields))
+            self.lengths.append(length)
+            self.links.add(link)
+            self._total_length += length
+
+            for term, count in term_counts.items():
+                if term not in self.postings:
+                    self.postings[term] = (array("I"), array("I"))
+
+                document_ids, counts = self.postings[term]
+                document_ids.append(document_id)
+                counts.append(count)
+
+        return True
+
+    def add_results(self, results):
+        """
+        Add the entries from a set of results from the API
+        """
+
+        if isinstance(results, SearchResults):
+            results = results.to_dict()
+
+        for entry in results.get("entries", []):
+            if entry.get("link") and entry.get("title"):
+                self.add_document(
+                    link=entry["link"],
+                    title=entry["title"],
+                    snippet=entry.get("snippet", ""),
+                    body=entry.get("htmlSnippet", ""),
+                    **{
+                        field: entry[field]
+                        for field in ENTRY_FIELDS
+                        if field in entry and field not in ("link", "title")
+                    },
+                )
+
+    def search(self, query, start=None, num=None, site_search=None):
+        """
+        Return a page of results for `query`, on `site_search` if set,
+        in the same shape as results from the API
+        """
+
+        start = int(start or 1)
+        num = int(num or 10)
+
+        with self._lock:
+            total = len(self.entries)
+            average_length = self._total_length / total if total else 0
+            scores = {}
+
+            for term in set(tokenize(query)):
+                if term not in self.postings:
+                    continue
+
+                document_ids, counts = self.postings[term]
+
+                for document_id, count in zip(document_ids, counts):
+                    scores[document_id] = scores.get(document_id, 0) + bm25(
+                        count,
+                        len(document_ids),
+                        self.lengths[document_id],
+                        average_length,
+                        total,
+                    )
+
+            ranked = sorted(scores, key=lambda id: (-scores[id], id))
+
+            if site_search:
+                ranked = [
+                    document_id
+                    for document_id in ranked
+                    if matches_site(
+                        self.entries[document_id]["link"], site_search
+                    )
+                ]
+
+            entries = [
+                dict(self.entries[document_id])
+                for document_id in ranked[start - 1 : start - 1 + num]
+            ]
+
+        return build_results(entries, len(ranked), start, num)
+
+
+def write_index(path, documents):
+    """
+    Write documents to an index file, which MappedSearchIndex can
+    memory-map rather than load, so workers start instantly and share
+    the index through the page cache
+
+    Each document is a dictionary of its result "entry", weighted
+    "terms" counts and "length", as from `count_terms`.
+
+    The file is little-endian, laid out as:
+
+    - header: INDEX_HEADER - magic, document and term counts, average
+      document length, and the offset of each following section
+    - term records: TERM_RECORD for each term, sorted by term - the
+      term's offset and length in the term text, and the offset and
+      count of its postings
+    - term text: UTF-8 terms, back to back
+    - postings: POSTING pairs of document id and term count
+    - lengths: a uint32 length for each document
+    - document offsets: a uint64 offset for each document's JSON entry,
+      and one for the end of the last
+    - documents: JSON entries, back to back
+    - link offsets: a uint64 offset for each document's link, and one
+      for the end of the last
+    - links: UTF-8 links, back to back, to filter by site without
+      decoding entries
+    """
+
+    documents = list(documents)
+    postings = {}
+
+    for document_id, document in enumerate(documents):
+        for term, count in document["terms"].items():
+            postings.setdefault(term, []).append((document_id, count))
+
+    terms = sorted(postings)
+    encoded_terms = [term.encode("utf-8") for term in terms]
+    total_length = sum(document["length"] for document in documents)
+    average_length = total_length / len(documents) if documents else 0
+
+    term_records = bytearray()
+    term_text = bytearray()
+    posting_data = bytearray()
+
+    for term, encoded_term in zip(terms, encoded_terms):
+        term_records += TERM_RECORD.pack(
+            len(term_text),
+            len(encoded_term),
+            len(posting_data),
+            len(postings[term]),
+        )
+        term_text += encoded_term
+
+        for document_id, count in postings[term]:
+            posting_data += POSTING.pack(document_id, count)
+
+    lengths = array("I", (document["length"] for document in documents))
+    entries = [dumps(document["entry"]) for document in documents]
+    entry_offsets = array("Q", [0])
+    links = [
+        document["entry"]["link"].encode("utf-8") for document in documents
+    ]
+    link_offsets = array("Q", [0])
+
+    for entry in entries:
+        entry_offsets.append(entry_offsets[-1] + len(entry))
+
+    for link in links:
+        link_offsets.append(link_offsets[-1] + len(link))
+
+    if lengths.itemsize != 4 or entry_offsets.itemsize != 8:
+        raise RuntimeError("Unsupported platform integer sizes")
+
+    sections = [
+        bytes(term_records),
+        bytes(term_text),
+        bytes(posting_data),
+        _little_endian(lengths),
+        _little_endian(entry_offsets),
+        b"".join(entries),
+        _little_endian(link_offsets),
+        b"".join(links),
+    ]
+    offsets = []
+    position = INDEX_HEADER.size
+
+    for section in sections:
+        offsets.append(position)
+        position += len(section)
+
+    header = INDEX_HEADER.pack(
+        INDEX_MAGIC,
+        len(documents),
+        len(terms),
+        average_length,
+        *offsets,
+    )
+
+    # Write to a temporary file first, so workers mapping the old index
+    # keep working, and never see a partially written one
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+
+    with os.fdopen(file_descriptor, "wb") as index_file:
+        index_file.write(header)
+
+        for section in sections:
+            index_file.write(section)
+
+    os.replace(temporary_path, path)
+
+
+def _little_endian(values):
+    if struct.pack("=I", 1) != struct.pack("<I", 1):
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    return values.tobytes()
+
+
+class MappedSearchIndex:
+    """
+    A read-only index written by `write_index` (e.g. with the
+    `canonicalwebteam-search-index` command), memory-mapped
+    rather than loaded, so it costs nothing at startup
+    """
+
+    learn = False
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as index_file:
+            self._map = mmap.mmap(
+                index_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+
+        (
+            magic,
+            self.document_count,
+            self.term_count,
+            self.average_length,
+            self._term_records,
+            self._term_text,
+            self._postings,
+            self._lengths,
+            self._entry_offsets,
+            self._entries,
+            self._link_offsets,
+            self._links,
+        ) = INDEX_HEADER.unpack_from(self._map)
+
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a search index")
+
+        self._terms = _TermView(self)
+
+    def __len__(self):
+        return self.document_count
+
+    def close(self):
+        self._map.close()
+
+    def _read_term(self, index):
+        text_offset, text_length, _, _ = TERM_RECORD.unpack_from(
+            self._map, self._term_records + index * TERM_RECORD.size
+        )
+        start = self._term_text + text_offset
+
+        return self._map[start : start + text_length]
+
+    def _read_postings(self, term):
+        """
+        Return (document id, count) pairs for `term`, by binary search
+        through the sorted term records
+        """
+
+        encoded_term = term.encode("utf-8")
+        index = bisect.bisect_left(self._terms, encoded_term)
+
+        if index == self.term_count or self._terms[index] != encoded_term:
+            return []
+
+        _, _, postings_offset, postings_count = TERM_RECORD.unpack_from(
+            self._map, self._term_records + index * TERM_RECORD.size
+        )
+        start = self._postings + postings_offset
+
+        return POSTING.iter_unpack(
+            self._map[start : start + postings_count * POSTING.size]
+        )
+
+    def _read_length(self, document_id):
+        return struct.unpack_from(
+            "<I", self._map, self._lengths + document_id * 4
+        )[0]
+
+    def _read_entry(self, document_id):
+        start, end = struct.unpack_from(
+            "<QQ", self._map, self._entry_offsets + document_id * 8
+        )
+
+        return loads(self._map[self._entries + start : self._entries + end])
+
+    def _read_link(self, document_id):
+        start, end = struct.unpack_from(
+            "<QQ", self._map, self._link_offsets + document_id * 8
+        )
+
+        return self._map[self._links + start : self._links + end].decode(
+            "utf-8"
+        )
+
+    def search(self, query, start=None, num=None, site_search=None):
+        """
+        Return a page of results for `query`, on `site_search` if set,
+        in the same shape as results from the API
+        """
+
+        start = int(start or 1)
+        num = int(num or 10)
+        scores = {}
+
+        for term in set(tokenize(query)):
+            postings = list(self._read_postings(term))
+
+            for document_id, count in postings:
+                scores[document_id] = scores.get(document_id, 0) + bm25(
+                    count,
+                    len(postings),
+                    self._read_length(document_id),
+                    self.average_length,
+                    self.document_count,
+                )
+
+        ranked = sorted(scores, key=lambda id: (-scores[id], id))
+
+        if site_search:
+            ranked = [
+                document_id
+                for document_id in ranked
+                if matches_site(self._read_link(document_id), site_search)
+            ]
+
+        entries = [
+            self._read_entry(document_id)
+            for document_id in ranked[start - 1 : start - 1 + num]
+        ]
+
+        return build_results(entries, len(ranked), start, num)
+
+
+class _TermView:
+    """
+    A sequence of the terms in a MappedSearchIndex, read on demand,
+    for bisect
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return self.index.term_count
+
+    def __getitem__(self, position):
+        return self.index._read_term(position)
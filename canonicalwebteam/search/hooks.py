@@ -0,0 +1,83 @@
+# Standard library
+import time
+from urllib.parse import urlsplit
+
+# Only responses from here are calls to the API
+API_HOST = "www.googleapis.com"
+
+
+class UpstreamHooks:
+    """
+    Hooks for a requests session or httpx client, which pass the status
+    and latency of each response from the API - and not from anywhere
+    else the session is used for - to each observer.
+
+    Views sharing a session share its hooks, and observers are added
+    by key, so each response is only counted once.
+    """
+
+    def __init__(self):
+        self.observers = {}
+
+    def add(self, key, observer):
+        """
+        Call `observer(status, seconds)` for each response from the API,
+        unless an observer with the same `key` is already added
+        """
+
+        self.observers.setdefault(key, observer)
+
+    def _notify(self, status, seconds):
+        for observer in list(self.observers.values()):
+            observer(status, seconds)
+
+    def __call__(self, response, **kwargs):
+        """
+        A requests response hook
+        """
+
+        if urlsplit(response.url).hostname == API_HOST:
+            self._notify(
+                response.status_code, response.elapsed.total_seconds()
+            )
+
+    async def start_timer(self, request):
+        """
+        An httpx request hook
+        """
+
+        if request.url.host == API_HOST:
+            request.extensions["search_started"] = time.perf_counter()
+
+    async def observe(self, response):
+        """
+        An httpx response hook
+        """
+
+        started = response.request.extensions.get("search_started")
+
+        if started is not None:
+            self._notify(response.status_code, time.perf_counter() - started)
+
+    def event_hooks(self):
+        """
+        Return the hooks to create an httpx client with
+        """
+
+        return {"request": [self.start_timer], "response": [self.observe]}
+
+
+def get_session_hooks(session):
+    """
+    Return the UpstreamHooks of a requests session, adding them
+    if they aren't there yet
+    """
+
+    for hook in session.hooks["response"]:
+        if isinstance(hook, UpstreamHooks):
+            return hook
+
+    hooks = UpstreamHooks()
+    session.hooks["response"].append(hooks)
+
+    return hooks
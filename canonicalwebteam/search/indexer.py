@@ -0,0 +1,291 @@
+"""
+Build an index file for MappedSearchIndex, from a directory of HTML and
+Markdown files or a JSON lines dump:
+
+    canonicalwebteam-search-index build/ search.index \
+        --base-url https://ubuntu.com
+
+Documents unchanged since the last run are taken from a manifest
+kept next to the index, rather than tokenized again.
+"""
+
+# Standard library
+import argparse
+import hashlib
+import os
+import re
+import sys
+import tempfile
+from html.parser import HTMLParser
+
+# Local
+from canonicalwebteam.search.fallback import (
+    build_entry,
+    count_terms,
+    write_index,
+)
+from canonicalwebteam.search.jsonlib import dumps, loads
+
+HTML_EXTENSIONS = (".html", ".htm")
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+FRONT_MATTER_PATTERN = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.DOTALL)
+SNIPPET_LENGTH = 200
+
+
+class _TextParser(HTMLParser):
+    """
+    Collect the title and visible text of an HTML page
+    """
+
+    skipped_tags = ("script", "style", "template", "noscript")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = ""
+        self.text = []
+        self._tags = []
+
+    def handle_starttag(self, tag, attrs):
+        self._tags.append(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._tags:
+            while self._tags.pop() != tag:
+                pass
+
+    def handle_data(self, data):
+        if "title" in self._tags:
+            self.title += data
+        elif not any(tag in self.skipped_tags for tag in self._tags):
+            self.text.append(data)
+
+
+def _summarize(text):
+    text = " ".join(text.split())
+
+    if len(text) <= SNIPPET_LENGTH:
+        return text
+
+    return text[:SNIPPET_LENGTH].rsplit(" ", 1)[0] + " ..."
+
+
+def parse_html(content):
+    """
+    Return the title and text of an HTML page
+    """
+
+    parser = _TextParser()
+    parser.feed(content)
+    parser.close()
+
+    return " ".join(parser.title.split()), " ".join(parser.text)
+
+
+def parse_markdown(content):
+    """
+    Return the title and text of a Markdown document, taking the title
+    from its front matter or its first heading
+    """
+
+    title = ""
+    front_matter = FRONT_MATTER_PATTERN.match(content)
+
+    if front_matter:
+        content = content[front_matter.end() :]
+
+        for line in front_matter.group(1).splitlines():
+            name, _, value = line.partition(":")
+
+            if name.strip() == "title":
+                title = value.strip().strip("\"'")
+
+    if not title:
+        heading = re.search(r"^#\s+(.+)$", content, re.MULTILINE)
+        title = heading.group(1).strip() if heading else ""
+
+    return title, content
+
+
+def read_directory(directory, base_url=""):
+    """
+    Yield an (id, source) tuple for each HTML or Markdown file in
+    `directory`, linked from `base_url` by its path without extension
+    """
+
+    for root, _, filenames in sorted(os.walk(directory)):
+        for filename in sorted(filenames):
+            name, extension = os.path.splitext(filename)
+
+            if extension not in HTML_EXTENSIONS + MARKDOWN_EXTENSIONS:
+                continue
+
+            path = os.path.join(root, filename)
+            relative_path = os.path.relpath(path, directory)
+            link_path = os.path.splitext(relative_path)[0].replace(os.sep, "/")
+
+            if name == "index":
+                link_path = link_path[: -len("index")].rstrip("/")
+
+            with open(path, "rb") as source_file:
+                content = source_file.read()
+
+            yield relative_path, {
+                "path": relative_path,
+                "link": f"{base_url.rstrip('/')}/{link_path}",
+                "content": content,
+            }
+
+
+def read_jsonl(path):
+    """
+    Yield an (id, source) tuple for each document in a JSON lines dump,
+    with "link", "title" and optionally "snippet", "body" and any other
+    result fields
+    """
+
+    with open(path, "rb") as jsonl_file:
+        for line in jsonl_file:
+            if line.strip():
+                document = loads(line)
+
+                yield document["link"], {
+                    "link": document["link"],
+                    "document": document,
+                    "content": line,
+                }
+
+
+def build_document(source):
+    """
+    Tokenize a source into the document write_index expects
+    """
+
+    if "document" in source:
+        document = dict(source["document"])
+        link = document.pop("link")
+        title = document.pop("title")
+        snippet = document.pop("snippet", "")
+        body = document.pop("body", None)
+    else:
+        content = source["content"].decode("utf-8", errors="replace")
+        link = source["link"]
+
+        if source["path"].endswith(HTML_EXTENSIONS):
+            title, body = parse_html(content)
+        else:
+            title, body = parse_markdown(content)
+
+        title = title or link
+        snippet = _summarize(body)
+        document = {}
+
+    terms, length = count_terms(title, snippet if body is None else body)
+
+    return {
+        "entry": build_entry(link, title, snippet, **document),
+        "terms": terms,
+        "length": length,
+    }
+
+
+def build_index(source, output, base_url="", full=False):
+    """
+    Write an index of `source`, a directory or JSON lines file, to
+    `output`, only tokenizing documents changed since the last build
+    unless `full` is set.
+
+    Returns counts of the documents indexed, and of those reused from
+    the last build.
+    """
+
+    manifest_path = f"{output}.manifest.json"
+    previous = {}
+
+    if not full:
+        try:
+            with open(manifest_path, "rb") as manifest_file:
+                previous = loads(manifest_file.read())
+        except (OSError, ValueError):
+            previous = {}
+
+    if os.path.isdir(source):
+        sources = read_directory(source, base_url)
+    else:
+        sources = read_jsonl(source)
+
+    manifest = {}
+    reused = 0
+
+    for source_id, item in sources:
+        digest = hashlib.sha256(item["content"]).hexdigest()
+        entry = previous.get(source_id)
+
+        # A file's link changes with the base URL, but not its content
+        if (
+            entry is not None
+            and entry["hash"] == digest
+            and entry["entry"]["link"] == item["link"]
+        ):
+            reused += 1
+        else:
+            entry = {"hash": digest, **build_document(item)}
+
+        manifest[source_id] = entry
+
+    write_index(output, manifest.values())
+
+    # The manifest is written after the index, so a failed build
+    # is simply redone next time
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=directory)
+
+    with os.fdopen(file_descriptor, "wb") as manifest_file:
+        manifest_file.write(dumps(manifest))
+
+    os.replace(temporary_path, manifest_path)
+
+    return {"documents": len(manifest), "reused": reused}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="canonicalwebteam-search-index",
+        description=(
+            "Build a search index file from a directory of HTML and "
+            "Markdown files, or a JSON lines dump, to fall back on "
+            "with MappedSearchIndex"
+        ),
+    )
+    parser.add_argument(
+        "source", help="A directory of documents, or a .jsonl file"
+    )
+    parser.add_argument("output", help="Where to write the index")
+    parser.add_argument(
+        "--base-url",
+        default="",
+        help="The URL that paths in a source directory are relative to",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Tokenize every document, rather than only changed ones",
+    )
+    arguments = parser.parse_args(argv)
+
+    counts = build_index(
+        arguments.source,
+        arguments.output,
+        base_url=arguments.base_url,
+        full=arguments.full,
+    )
+
+    print(
+        f"Indexed {counts['documents']} documents into {arguments.output} "
+        f"({counts['documents'] - counts['reused']} changed)"
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
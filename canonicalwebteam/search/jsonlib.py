@@ -0,0 +1,37 @@
+# Standard library
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# Use the fastest JSON library installed. `loads` accepts bytes or str,
+# and `dumps` always returns UTF-8 encoded bytes
+if orjson is not None:
+    backend = "orjson"
+
+    loads = orjson.loads
+    dumps = orjson.dumps
+
+elif ujson is not None:
+    backend = "ujson"
+
+    loads = ujson.loads
+
+    def dumps(value):
+        return ujson.dumps(value, ensure_ascii=False).encode("utf-8")
+
+else:
+    backend = "json"
+
+    loads = json.loads
+
+    def dumps(value):
+        return json.dumps(value, ensure_ascii=False).encode("utf-8")
@@ -0,0 +1,164 @@
+# Packages
+try:
+    import prometheus_client
+    from prometheus_client.core import CounterMetricFamily
+except ImportError:
+    prometheus_client = None
+
+
+class SearchMetrics:
+    """
+    Hooks called as searches are served, which record nothing.
+
+    Subclass it to send measurements elsewhere, or use
+    `PrometheusMetrics`.
+    """
+
+    def observe_upstream(self, status, seconds):
+        """
+        An API response with HTTP `status`, which took `seconds`
+        """
+
+    def observe_render(self, seconds):
+        """
+        Rendering the template took `seconds`
+        """
+
+    def observe_request(self, seconds):
+        """
+        Serving a search request took `seconds`, in total
+        """
+
+    def record_bot_rejection(self, rule):
+        """
+        A search was blocked by a crawler `rule`, e.g. "prefix:curl"
+        """
+
+    def record_illegal_character(self):
+        """
+        A search was blocked for an illegal character
+        """
+
+    def record_rate_limited(self):
+        """
+        A search was turned away by the rate limit
+        """
+
+    def watch_cache(self, cache):
+        """
+        Report the hits and misses counted by a `SearchCache`
+        """
+
+
+class PrometheusMetrics(SearchMetrics):
+    """
+    Record search metrics with prometheus_client
+    (`pip3 install canonicalwebteam.search[metrics]`), e.g.:
+
+        metrics = PrometheusMetrics()
+
+        build_search_view(app, metrics=metrics)
+
+    Create one and share it between views, as metrics can only be
+    registered once in a `registry`.
+    """
+
+    def __init__(self, registry=None, namespace="search"):
+        if prometheus_client is None:
+            raise ImportError(
+                "PrometheusMetrics requires prometheus_client: "
+                "pip3 install canonicalwebteam.search[metrics]"
+            )
+
+        if registry is None:
+            registry = prometheus_client.REGISTRY
+
+        options = {"namespace": namespace, "registry": registry}
+
+        self.upstream_duration = prometheus_client.Histogram(
+            "upstream_duration_seconds",
+            "Time taken by the search API to respond",
+            **options,
+        )
+        self.upstream_responses = prometheus_client.Counter(
+            "upstream_responses",
+            "Responses from the search API, by HTTP status",
+            ["status"],
+            **options,
+        )
+        self.render_duration = prometheus_client.Histogram(
+            "render_duration_seconds",
+            "Time taken to render search templates",
+            **options,
+        )
+        self.request_duration = prometheus_client.Histogram(
+            "request_duration_seconds",
+            "Time taken to serve search requests",
+            **options,
+        )
+        self.bot_rejections = prometheus_client.Counter(
+            "bot_rejections",
+            "Searches blocked as from web crawlers, by rule",
+            ["rule"],
+            **options,
+        )
+        self.illegal_character_rejections = prometheus_client.Counter(
+            "illegal_character_rejections",
+            "Searches blocked for illegal characters",
+            **options,
+        )
+        self.rate_limit_rejections = prometheus_client.Counter(
+            "rate_limit_rejections",
+            "Searches turned away by the rate limit",
+            **options,
+        )
+
+        self.namespace = namespace
+        self.caches = []
+        registry.register(self)
+
+    def observe_upstream(self, status, seconds):
+        self.upstream_duration.observe(seconds)
+        self.upstream_responses.labels(str(status)).inc()
+
+    def observe_render(self, seconds):
+        self.render_duration.observe(seconds)
+
+    def observe_request(self, seconds):
+        self.request_duration.observe(seconds)
+
+    def record_bot_rejection(self, rule):
+        self.bot_rejections.labels(rule).inc()
+
+    def record_illegal_character(self):
+        self.illegal_character_rejections.inc()
+
+    def record_rate_limited(self):
+        self.rate_limit_rejections.inc()
+
+    def watch_cache(self, cache):
+        if cache not in self.caches:
+            self.caches.append(cache)
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        """
+        Report the counts kept by watched caches, as a collector
+        """
+
+        families = {
+            name: CounterMetricFamily(
+                f"{self.namespace}_cache_{name}",
+                f"Search cache {name.replace('_', ' ')}",
+            )
+            for name in ["hits", "stale_hits", "misses"]
+        }
+
+        for name, family in families.items():
+            family.add_metric(
+                [], sum(cache.stats()[name] for cache in self.caches)
+            )
+
+            yield family
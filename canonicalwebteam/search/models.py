@@ -1,6 +1,51 @@
+# Standard library
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
 # Packages
 import flask
-import user_agents
+import requests
+from urllib3.exceptions import ReadTimeoutError
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Local
+from canonicalwebteam.search.budget import QuotaExceededError
+from canonicalwebteam.search.cache import build_cache_key
+from canonicalwebteam.search.jsonlib import loads
+from canonicalwebteam.search.results import SearchResults, compact_results
+from canonicalwebteam.search.rules import default_rules
+from canonicalwebteam.search.session import SearchSession
+from canonicalwebteam.search.singleflight import SingleFlightTimeout
+from canonicalwebteam.search.timing import timed
+
+logger = logging.getLogger(__name__)
+
+# Background workers for refreshing stale cache entries
+refresh_executor = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="search-refresh"
+)
+refreshing_keys = set()
+refreshing_lock = threading.Lock()
+
+# Workers for searches with a deadline, so we can stop waiting
+# once it passes, even while the API is still responding
+upstream_executor = ThreadPoolExecutor(
+    max_workers=32, thread_name_prefix="search-upstream"
+)
+
+# The longest we wait to connect to the API, within the time allowed
+CONNECT_TIMEOUT = 3.05
+
+# How much of a response to read between checking the deadline
+CHUNK_SIZE = 16384
 
 
 def get_search_results(
@@ -12,51 +57,339 @@ def get_search_results(
     start=None,
     num=None,
     siteSearch=None,
+    cache=None,
+    single_flight=None,
+    stale_while_revalidate=False,
+    stale_if_error=False,
+    rules=None,
+    compact=False,
+    timeout=None,
+    user_agent=None,
+    cache_only=False,
 ):
     """
     Query the Google Custom Search API for search results
 
     https://developers.google.com/custom-search/v1/site_restricted_api
+
+    If a `SearchCache` is provided, results are looked up there first
+    and stored there after a successful upstream call.
+
+    If a `SingleFlight` is provided, concurrent calls with the same
+    parameters share one upstream request.
+
+    With `stale_while_revalidate`, expired results still in the cache
+    are returned straight away while being refreshed in the background.
+    With `stale_if_error`, they are returned if the API fails with a
+    5xx or 429 error, rather than raising it.
+
+    Searches are blocked according to `rules` - a `SearchRules` or
+    `SearchRulesFile` - or the default rules if not provided.
+
+    With `compact`, only the fields needed to render results are kept,
+    and returned as a `SearchResults` instead of the full API response.
+
+    `timeout` limits how many seconds we wait for the API, from
+    connecting to reading the whole response, including waiting on a
+    concurrent identical search. When it runs out, stale results are
+    returned if there are any, otherwise the timeout error is raised.
+
+    Pass the `user_agent` explicitly when not running inside
+    a Flask request, e.g. from another thread.
+
+    With `cache_only`, the API isn't called at all: results are only
+    taken from the cache, even if stale, and `QuotaExceededError` is
+    raised if there are none.
+    """
+
+    if user_agent is None:
+        user_agent = str(flask.request.user_agent)
+
+    block_unwanted_searches(query, user_agent, rules)
+
+    url_endpoint = _get_url_endpoint(site_restricted_search)
+    params = _build_params(
+        api_key, search_engine_id, query, start, num, siteSearch
+    )
+    cache_key = build_cache_key(
+        url_endpoint, params, prefix=_get_cache_prefix(compact)
+    )
+    results = None
+    stale = False
+
+    if cache is not None:
+        results, stale = cache.lookup(cache_key)
+
+    def fetch():
+        fresh_results = _request_search_results(
+            session, url_endpoint, params, compact, timeout
+        )
+
+        if cache is not None:
+            cache.set(cache_key, fresh_results)
+
+        return fresh_results
+
+    if cache_only:
+        _check_cached_results(cache, results, stale)
+    elif results is not None and stale and stale_while_revalidate:
+        cache.record_stale_hit()
+        _refresh_in_background(cache_key, fetch)
+    elif results is None or stale:
+        try:
+            if single_flight is not None:
+                results = single_flight.do(cache_key, fetch, timeout)
+            else:
+                results = fetch()
+        except (
+            requests.exceptions.RequestException,
+            SingleFlightTimeout,
+        ) as error:
+            if results is None:
+                raise
+
+            if not is_timeout(error):
+                if not stale_if_error or not _is_upstream_error(error):
+                    raise
+
+            logger.warning(
+                f"Serving stale search results: {describe_error(error)}"
+            )
+            cache.record_stale_hit()
+
+    if compact:
+        return SearchResults.from_dict(results)
+
+    return results
+
+
+async def async_get_search_results(
+    client,
+    api_key,
+    query,
+    search_engine_id,
+    site_restricted_search,
+    start=None,
+    num=None,
+    siteSearch=None,
+    cache=None,
+    single_flight=None,
+    stale_if_error=False,
+    user_agent=None,
+    rules=None,
+    compact=False,
+    timeout=None,
+    cache_only=False,
+):
+    """
+    Query the Google Custom Search API for search results without
+    blocking, using an `httpx.AsyncClient`
+
+    Works like `get_search_results`, but takes an `AsyncSingleFlight`
+    for `single_flight`, and cancels requests after `timeout`. Pass the
+    `user_agent` explicitly when not running inside a Flask request,
+    e.g. from Quart.
+    """
+
+    if user_agent is None:
+        user_agent = str(flask.request.user_agent)
+
+    block_unwanted_searches(query, user_agent, rules)
+
+    url_endpoint = _get_url_endpoint(site_restricted_search)
+    params = _build_params(
+        api_key, search_engine_id, query, start, num, siteSearch
+    )
+    cache_key = build_cache_key(
+        url_endpoint, params, prefix=_get_cache_prefix(compact)
+    )
+    results = None
+    stale = False
+
+    if cache is not None:
+        results, stale = cache.lookup(cache_key)
+
+    async def fetch():
+        with timed("upstream"):
+            # Unlike requests, httpx sends empty values for None
+            response = await client.get(
+                url_endpoint,
+                params={
+                    name: value
+                    for name, value in params.items()
+                    if value is not None
+                },
+                **_get_request_options(timeout, httpx_timeout=True),
+            )
+            response.raise_for_status()
+
+        fresh_results = _decode_results(response.content, compact)
+
+        if cache is not None:
+            cache.set(cache_key, fresh_results)
+
+        return fresh_results
+
+    if cache_only:
+        _check_cached_results(cache, results, stale)
+    elif results is None or stale:
+        try:
+            if single_flight is not None:
+                results = await single_flight.do(cache_key, fetch, timeout)
+            else:
+                results = await asyncio.wait_for(fetch(), timeout)
+        except (
+            httpx.HTTPError,
+            SingleFlightTimeout,
+            asyncio.TimeoutError,
+        ) as error:
+            if results is None:
+                raise
+
+            if not is_timeout(error):
+                if not stale_if_error or not _is_upstream_error(error):
+                    raise
+
+            logger.warning(
+                f"Serving stale search results: {describe_error(error)}"
+            )
+            cache.record_stale_hit()
+
+    if compact:
+        return SearchResults.from_dict(results)
+
+    return results
+
+
+def prefetch_search_results(
+    session,
+    api_key,
+    query,
+    search_engine_id,
+    site_restricted_search,
+    cache,
+    start=None,
+    num=None,
+    siteSearch=None,
+    compact=False,
+    timeout=None,
+    budget=None,
+    background=True,
+):
     """
+    Fetch search results into the cache in a background worker,
+    unless fresh results are already there
+
+    If provided, `budget` is called before making the request,
+    and the request is skipped if it returns False.
+
+    Both checks are made in the background too, as they may each
+    be a round trip to the cache or the budget's storage.
+
+    Without `background`, the results are fetched straight away,
+    raising any error, and it returns whether a request was made.
+    Otherwise, it returns whether the fetch was queued.
+    """
+
+    url_endpoint = _get_url_endpoint(site_restricted_search)
+    params = _build_params(
+        api_key, search_engine_id, query, start, num, siteSearch
+    )
+    cache_key = build_cache_key(
+        url_endpoint, params, prefix=_get_cache_prefix(compact)
+    )
+
+    def fetch():
+        if cache.is_fresh(cache_key):
+            return False
+
+        if budget is not None and not budget():
+            return False
+
+        results = _request_search_results(
+            session, url_endpoint, params, compact, timeout
+        )
+        cache.set(cache_key, results)
+
+        return True
+
+    if background:
+        return _refresh_in_background(cache_key, fetch)
+
+    return fetch()
+
+
+def get_next_page_start(results):
+    """
+    Return the start index of the next page of results, if there is one
+    """
+
+    if isinstance(results, SearchResults):
+        queries = results.queries
+    else:
+        queries = results.get("queries", {})
+
+    next_pages = queries.get("nextPage")
+
+    if next_pages:
+        return next_pages[0].get("startIndex")
+
+    return None
+
+
+def block_unwanted_searches(query, user_agent, rules=None, metrics=None):
+    """
+    Abort with a 403 for queries with illegal characters,
+    or from web crawlers, counting them in `metrics` if provided
+    """
+
+    rules = (rules or default_rules).current()
 
     # Block weird characters
-    illegal_characters = ("【", "】")
+    if rules.illegal_character(query):
+        if metrics is not None:
+            metrics.record_illegal_character()
 
-    if any(char in query for char in illegal_characters):
         flask.abort(403, "Search query contains an illegal character")
 
     # Block web crawlers
-    bot_prefixes = (
-        "python",  # python-requests/, python-urllib3/, Python/ etc.
-        "Go-http-client",
-        "kube-probe",
-        "Prometheus",
-        "curl",
-        "urlwatch",
-        "GuzzleHttp",
-        "Feedly",
-        "github-camo",
-        "Site24x7",
-        "check_http",
-        "Tiny Tiny RSS",
-        "RSS Discovery Engine",
-        "NetNewsWire",
-        "ALittle Client",
-        "gh",
-    )
-    bot_contains = (
-        "HeadlessChrome/",
-        "Assetnote/",
-        "PetalBot",
-    )
-    agent = user_agents.parse(str(flask.request.user_agent))
-    if (
-        agent.is_bot
-        or agent.ua_string.startswith(bot_prefixes)
-        or any(substr in agent.ua_string for substr in bot_contains)
-    ):
+    bot_rule = rules.bot_rule(user_agent)
+
+    if bot_rule:
+        if metrics is not None:
+            metrics.record_bot_rejection(bot_rule)
+
         flask.abort(403, "Web crawlers may not perform searches")
 
+
+def describe_error(error):
+    """
+    Describe an error for logging, without the request URL,
+    as it contains our API key
+    """
+
+    response = getattr(error, "response", None)
+
+    if response is not None:
+        return f"HTTP {response.status_code}"
+
+    return type(error).__name__
+
+
+def _check_cached_results(cache, results, stale):
+    """
+    Make sure there are cached results to serve in place of calling
+    the API, and count them if they're stale
+    """
+
+    if results is None:
+        raise QuotaExceededError("No cached results to serve without the API")
+
+    if stale:
+        cache.record_stale_hit()
+
+
+def _get_url_endpoint(site_restricted_search):
     url_endpoint = "https://www.googleapis.com/customsearch/v1"
 
     if site_restricted_search:
@@ -64,22 +397,217 @@ def get_search_results(
             "https://www.googleapis.com/customsearch/v1/siterestrict"
         )
 
-    response = session.get(
-        url_endpoint,
-        params={
-            "key": api_key,
-            "cx": search_engine_id,
-            "q": query,
-            "start": start,
-            "num": num,
-            "siteSearch": siteSearch,
-        },
+    return url_endpoint
+
+
+def _build_params(api_key, search_engine_id, query, start, num, siteSearch):
+    return {
+        "key": api_key,
+        "cx": search_engine_id,
+        "q": query,
+        "start": start,
+        "num": num,
+        "siteSearch": siteSearch,
+    }
+
+
+def _is_upstream_error(error):
+    """
+    Whether an error is the API failing or throttling us,
+    rather than a problem with our request
+    """
+
+    response = getattr(error, "response", None)
+
+    if response is not None:
+        return response.status_code == 429 or response.status_code >= 500
+
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+
+    return isinstance(error, requests.exceptions.ConnectionError)
+
+
+def is_quota_error(error):
+    """
+    Whether an error from the API means we've run out of quota
+    """
+
+    response = getattr(error, "response", None)
+
+    if response is None:
+        return False
+
+    if response.status_code == 429:
+        return True
+
+    return response.status_code == 403 and any(
+        reason in response.text
+        for reason in (
+            "quotaExceeded",
+            "dailyLimitExceeded",
+            "rateLimitExceeded",
+        )
     )
 
-    response.raise_for_status()
 
-    results = response.json()
+def is_timeout(error):
+    """
+    Whether a search failed by running out of time, including when
+    a session with retries gives up after a read timeout
+    """
+
+    if httpx is not None and isinstance(error, httpx.TimeoutException):
+        return True
+
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], "reason", None) if error.args else None
 
+        return isinstance(reason, ReadTimeoutError)
+
+    return isinstance(
+        error,
+        (
+            requests.exceptions.Timeout,
+            SingleFlightTimeout,
+            asyncio.TimeoutError,
+        ),
+    )
+
+
+def _get_request_options(timeout, httpx_timeout=False):
+    """
+    Split the time allowed for a search into connect and read timeouts,
+    or leave the client's default timeouts if there is no limit
+    """
+
+    if timeout is None:
+        return {}
+
+    connect_timeout = min(CONNECT_TIMEOUT, timeout)
+
+    if httpx_timeout:
+        return {"timeout": httpx.Timeout(timeout, connect=connect_timeout)}
+
+    return {"timeout": (connect_timeout, timeout)}
+
+
+def _refresh_in_background(cache_key, fetch):
+    """
+    Run `fetch` in a background worker, unless a refresh
+    for the same key is already queued. Returns whether it queued it.
+    """
+
+    with refreshing_lock:
+        if cache_key in refreshing_keys:
+            return False
+
+        refreshing_keys.add(cache_key)
+
+    def refresh():
+        try:
+            fetch()
+        except Exception as error:
+            logger.warning(
+                f"Failed to refresh search results for {cache_key}: "
+                f"{describe_error(error)}"
+            )
+        finally:
+            with refreshing_lock:
+                refreshing_keys.discard(cache_key)
+
+    refresh_executor.submit(refresh)
+
+    return True
+
+
+def _get_cache_prefix(compact):
+    # Compact and full results can't be used in place of each other
+    if compact:
+        return "canonicalwebteam.search.compact"
+
+    return "canonicalwebteam.search"
+
+
+def _request_search_results(
+    session, url_endpoint, params, compact=False, timeout=None
+):
+    """
+    Make the request to the Google Custom Search API
+    and tidy up the results
+    """
+
+    if timeout is None:
+        with timed("upstream"):
+            response = session.get(url_endpoint, params=params)
+
+            response.raise_for_status()
+
+        return _decode_results(response.content, compact)
+
+    options = _get_request_options(timeout)
+
+    # Retrying could take us past the time allowed
+    if isinstance(session, SearchSession):
+        options["retries"] = False
+
+    # Socket timeouts only limit each wait for the API, so the call
+    # runs in a worker, and we stop waiting for it at the deadline
+    deadline = time.perf_counter() + timeout
+    future = upstream_executor.submit(
+        _read_before_deadline, session, url_endpoint, params, options, deadline
+    )
+
+    with timed("upstream"):
+        try:
+            content = future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+
+            raise requests.exceptions.Timeout(
+                f"No response from the API within {timeout}s"
+            )
+
+    return _decode_results(content, compact)
+
+
+def _read_before_deadline(session, url_endpoint, params, options, deadline):
+    """
+    Return the body of a response from the API, giving up on reading it
+    once past `deadline` (from `time.perf_counter`)
+    """
+
+    response = session.get(url_endpoint, params=params, stream=True, **options)
+
+    if not response.ok:
+        # Read errors in full, for is_quota_error
+        response.content
+        response.raise_for_status()
+
+    chunks = []
+
+    for chunk in response.iter_content(CHUNK_SIZE):
+        chunks.append(chunk)
+
+        if time.perf_counter() > deadline:
+            response.close()
+
+            raise requests.exceptions.Timeout(
+                "The API was still responding at the deadline"
+            )
+
+    return b"".join(chunks)
+
+
+def _decode_results(content, compact=False):
+    with timed("decode"):
+        results = loads(content)
+
+    with timed("process"):
+        return _tidy_results(results, compact)
+
+
+def _tidy_results(results, compact=False):
     if "items" in results:
         # Move "items" to "entries" as "items" is a method name for dicts
         results["entries"] = results.pop("items")
@@ -89,4 +617,7 @@ def get_search_results(
             if "htmlSnippet" in item:
                 item["htmlSnippet"] = item["htmlSnippet"].replace("<br>\n", "")
 
+    if compact:
+        return compact_results(results)
+
     return results
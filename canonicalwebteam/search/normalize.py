@@ -0,0 +1,57 @@
+# Standard library
+import unicodedata
+
+# The values Google uses when "start", "num" or "siteSearch" are omitted
+DEFAULT_START = 1
+DEFAULT_NUM = 10
+
+
+def normalize_query(query):
+    """
+    Reduce a search query to a canonical form, so that e.g. "Snap",
+    " snap " and "snap  " are all searched for (and cached) as "snap".
+
+    Applies Unicode NFKC normalization, case folding and collapses
+    runs of whitespace.
+    """
+
+    if not query:
+        return ""
+
+    query = unicodedata.normalize("NFKC", query).casefold()
+
+    return " ".join(query.split())
+
+
+def _normalize_integer(value, default):
+    """
+    Parse "start" and "num" into canonical strings, dropping invalid
+    values and values that match Google's default
+    """
+
+    try:
+        number = int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+    if number == default or number < 1:
+        return None
+
+    return str(number)
+
+
+def normalize_search_params(query, start=None, num=None, siteSearch=None):
+    """
+    Return the canonical set of parameters for a search, with
+    defaults represented as None so they're left out of the upstream
+    request and the cache key alike
+    """
+
+    site_search = siteSearch.strip() if siteSearch else None
+
+    return {
+        "query": normalize_query(query),
+        "start": _normalize_integer(start, DEFAULT_START),
+        "num": _normalize_integer(num, DEFAULT_NUM),
+        "siteSearch": site_search or None,
+    }
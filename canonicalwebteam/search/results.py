@@ -0,0 +1,98 @@
+# The fields of each result we render
+ENTRY_FIELDS = (
+    "title",
+    "htmlTitle",
+    "link",
+    "displayLink",
+    "htmlSnippet",
+    "formattedUrl",
+    "htmlFormattedUrl",
+)
+
+# The paging information we render, from "queries"
+PAGE_NAMES = ("request", "previousPage", "nextPage")
+PAGE_FIELDS = ("startIndex", "count", "totalResults")
+
+# The totals we render, from "searchInformation"
+INFORMATION_FIELDS = ("totalResults", "formattedTotalResults")
+
+
+def compact_results(results):
+    """
+    Reduce search results from the API to just the fields we render,
+    dropping e.g. "pagemap" and request metadata, so they take
+    less memory and cache space
+
+    Returns a plain dictionary, with the same shape as the original.
+    """
+
+    queries = results.get("queries", {})
+    information = results.get("searchInformation", {})
+
+    return {
+        "entries": [
+            {field: entry[field] for field in ENTRY_FIELDS if field in entry}
+            for entry in results.get("entries", [])
+        ],
+        "queries": {
+            name: [
+                {field: page[field] for field in PAGE_FIELDS if field in page}
+                for page in queries[name]
+            ]
+            for name in PAGE_NAMES
+            if name in queries
+        },
+        "searchInformation": {
+            field: information[field]
+            for field in INFORMATION_FIELDS
+            if field in information
+        },
+    }
+
+
+class SearchResult:
+    """
+    A single search result, with only the fields we render.
+    Missing fields are empty strings.
+    """
+
+    __slots__ = ENTRY_FIELDS
+
+    def __init__(self, **fields):
+        for field in ENTRY_FIELDS:
+            setattr(self, field, fields.get(field, ""))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in ENTRY_FIELDS}
+
+
+class SearchResults:
+    """
+    Compact search results, which templates can use in the same way as
+    the full results from the API, e.g. `results.entries` and
+    `results.queries.nextPage.0.startIndex`
+    """
+
+    __slots__ = ("entries", "queries", "searchInformation")
+
+    def __init__(self, entries=(), queries=None, searchInformation=None):
+        self.entries = list(entries)
+        self.queries = queries or {}
+        self.searchInformation = searchInformation or {}
+
+    @classmethod
+    def from_dict(cls, results):
+        return cls(
+            entries=[
+                SearchResult(**entry) for entry in results.get("entries", [])
+            ],
+            queries=results.get("queries"),
+            searchInformation=results.get("searchInformation"),
+        )
+
+    def to_dict(self):
+        return {
+            "entries": [entry.to_dict() for entry in self.entries],
+            "queries": self.queries,
+            "searchInformation": self.searchInformation,
+        }
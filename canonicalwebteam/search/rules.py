@@ -0,0 +1,139 @@
+# Standard library
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+# Local
+from canonicalwebteam.search.bots import (
+    BOT_CONTAINS,
+    BOT_PREFIXES,
+    BotMatcher,
+)
+
+logger = logging.getLogger(__name__)
+
+# Queries containing these are blocked
+ILLEGAL_CHARACTERS = ("【", "】")
+
+
+class SearchRules:
+    """
+    The rules for blocking searches - user agent prefixes and
+    substrings for web crawlers, and characters not allowed in queries.
+
+    Rules are compiled once, when the object is created, so build a new
+    SearchRules rather than changing one.
+    """
+
+    def __init__(
+        self,
+        bot_prefixes=BOT_PREFIXES,
+        bot_contains=BOT_CONTAINS,
+        illegal_characters=ILLEGAL_CHARACTERS,
+    ):
+        self.bot_matcher = BotMatcher(bot_prefixes, bot_contains)
+        self.illegal_characters = tuple(illegal_characters)
+
+        self._illegal_pattern = None
+
+        if self.illegal_characters:
+            self._illegal_pattern = re.compile(
+                "|".join(map(re.escape, self.illegal_characters))
+            )
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load rules from a JSON file, e.g.:
+
+            {
+                "bot_prefixes": ["curl", "python"],
+                "bot_contains": ["PetalBot"],
+                "illegal_characters": ["【", "】"]
+            }
+
+        Any rule set left out of the file keeps its default.
+        """
+
+        with open(path, encoding="utf-8") as rules_file:
+            config = json.load(rules_file)
+
+        return cls(
+            bot_prefixes=config.get("bot_prefixes", BOT_PREFIXES),
+            bot_contains=config.get("bot_contains", BOT_CONTAINS),
+            illegal_characters=config.get(
+                "illegal_characters", ILLEGAL_CHARACTERS
+            ),
+        )
+
+    def current(self):
+        return self
+
+    def illegal_character(self, query):
+        """
+        Return the first illegal character in `query`, or None
+        """
+
+        if self._illegal_pattern:
+            illegal_match = self._illegal_pattern.search(query)
+
+            if illegal_match:
+                return illegal_match.group(0)
+
+        return None
+
+    def bot_rule(self, user_agent):
+        """
+        Return the rule identifying `user_agent` as a web crawler,
+        or None
+        """
+
+        return self.bot_matcher.match(user_agent)
+
+
+class SearchRulesFile:
+    """
+    Rules loaded from a JSON file (see `SearchRules.from_file`), which
+    are reloaded when the file changes, checking at most once every
+    `check_interval` seconds.
+
+    If the file can't be loaded, the previous rules stay in place.
+    """
+
+    def __init__(self, path, check_interval=5):
+        self.path = path
+        self.check_interval = check_interval
+        self._rules = SearchRules.from_file(path)
+        self._modified = os.stat(path).st_mtime_ns
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Return the latest rules, reloading them if the file has changed
+        """
+
+        if time.monotonic() - self._checked >= self.check_interval:
+            with self._lock:
+                self._reload_if_modified()
+
+        return self._rules
+
+    def _reload_if_modified(self):
+        self._checked = time.monotonic()
+
+        try:
+            modified = os.stat(self.path).st_mtime_ns
+
+            if modified != self._modified:
+                self._rules = SearchRules.from_file(self.path)
+                self._modified = modified
+                logger.info(f"Reloaded search rules from {self.path}")
+        except (OSError, ValueError) as error:
+            logger.warning(f"Failed to reload {self.path}: {error}")
+
+
+default_rules = SearchRules()
@@ -0,0 +1,108 @@
+# Standard library
+import threading
+
+# Packages
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Google's API returns these when it is struggling. 429s aren't retried,
+# as they mostly mean our quota is gone, which retrying won't fix
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class SearchSession(requests.Session):
+    """
+    A requests session for calling the Google Custom Search API:
+
+    - Keeps up to `pool_size` connections alive per host, which should
+      match the number of threads making searches, so they don't wait
+      for each other or re-handshake TLS
+    - Applies a default `timeout` - (connect, read) in seconds
+    - Retries failed connections and 5xx errors up to `retries` times,
+      backing off by `backoff_factor`. Read timeouts and 429s aren't
+      retried, nor does it wait for Retry-After, so a search fails
+      within its timeout, and we can fall back when out of quota.
+    """
+
+    def __init__(
+        self, pool_size=10, timeout=(3.05, 10), retries=2, backoff_factor=0.3
+    ):
+        super().__init__()
+
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                read=False,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=["GET"],
+                raise_on_status=False,
+                respect_retry_after_header=False,
+            ),
+        )
+
+        # For requests which must finish within their timeout, sharing
+        # the same connection pool
+        self.single_attempt_adapter = HTTPAdapter(
+            max_retries=Retry(total=0, read=False, raise_on_status=False)
+        )
+        self.single_attempt_adapter.poolmanager = self.adapter.poolmanager
+        self._local = threading.local()
+
+        self.mount("https://", self.adapter)
+        self.mount("http://", self.adapter)
+
+    def request(self, method, url, retries=True, **kwargs):
+        """
+        Make a request, with the default timeout unless one is given.
+        Without `retries`, it is tried only once, e.g. so a search
+        doesn't retry past the time allowed for it.
+        """
+
+        kwargs.setdefault("timeout", self.timeout)
+        self._local.retries = retries
+
+        try:
+            return super().request(method, url, **kwargs)
+        finally:
+            self._local.retries = True
+
+    def get_adapter(self, url):
+        adapter = super().get_adapter(url)
+
+        if adapter is self.adapter and not getattr(
+            self._local, "retries", True
+        ):
+            return self.single_attempt_adapter
+
+        return adapter
+
+    def pool_stats(self):
+        """
+        Return usage of each connection pool, by host:
+
+        - connections: connections opened so far
+        - requests: requests made so far
+        - idle: connections currently kept alive, waiting for a request
+        - size: the maximum number of connections kept alive
+        """
+
+        pools = self.adapter.poolmanager.pools
+        stats = {}
+
+        for key in pools.keys():
+            pool = pools[key]
+            idle = pool.pool.queue if pool.pool else []
+
+            stats[pool.host] = {
+                "connections": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": sum(1 for connection in idle if connection),
+                "size": pool.pool.maxsize if pool.pool else 0,
+            }
+
+        return stats
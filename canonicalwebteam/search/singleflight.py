@@ -0,0 +1,143 @@
+# Standard library
+import asyncio
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one, so that
+    e.g. dozens of threads searching for the same query at once only
+    make one request to the API and all share its result.
+
+    Waiters give up after `timeout` seconds (None waits forever),
+    raising SingleFlightTimeout. If the call raises an exception, every
+    waiter raises it too.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, timeout=None):
+        """
+        Return the result of `function()`, unless a call for `key` is
+        already in flight, in which case wait for and return its result
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.result = function()
+            except BaseException as error:
+                call.error = error
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+
+                call.done.set()
+
+            return call.result
+
+        if timeout is None:
+            timeout = self.timeout
+
+        if not call.done.wait(timeout):
+            raise SingleFlightTimeout(
+                f"Timed out after {timeout}s waiting for {key}"
+            )
+
+        if call.error is not None:
+            raise call.error
+
+        return call.result
+
+    def in_flight(self):
+        """
+        Return the number of calls currently in flight
+        """
+
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    The asyncio equivalent of SingleFlight, coalescing calls from
+    coroutines running on the same event loop.
+
+    Calls on different loops, like Flask's async views which each
+    run in an event loop of their own, are never coalesced, as a task
+    can only be awaited on the loop running it.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        # The tasks in flight on each event loop, by key
+        self._loop_tasks = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key, function, timeout=None):
+        """
+        Await `function()`, unless a call for `key` is already in
+        flight on this event loop, in which case wait for and return
+        its result
+        """
+
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            tasks = self._loop_tasks.setdefault(loop, {})
+            task = tasks.get(key)
+
+            if task is None:
+                task = tasks[key] = loop.create_task(function())
+                task.add_done_callback(
+                    lambda _: self._finish(loop, tasks, key)
+                )
+
+        if timeout is None:
+            timeout = self.timeout
+
+        try:
+            # Shield the shared task, so one caller timing out
+            # doesn't cancel it for everyone else
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise SingleFlightTimeout(
+                f"Timed out after {timeout}s waiting for {key}"
+            )
+
+    def _finish(self, loop, tasks, key):
+        with self._lock:
+            tasks.pop(key, None)
+
+            # Forget loops with nothing in flight, so they can be closed
+            if not tasks and self._loop_tasks.get(loop) is tasks:
+                del self._loop_tasks[loop]
+
+    def in_flight(self):
+        """
+        Return the number of calls currently in flight, on any loop
+        """
+
+        with self._lock:
+            return sum(len(tasks) for tasks in self._loop_tasks.values())
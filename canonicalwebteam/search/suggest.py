@@ -0,0 +1,132 @@
+# Standard library
+import bisect
+import hashlib
+import heapq
+import os
+import threading
+import time
+
+# Local
+from canonicalwebteam.search.normalize import normalize_query
+
+# Rescale scores before the weight of new searches grows past this
+MAX_WEIGHT = 2**32
+
+
+class QuerySuggestions:
+    """
+    Suggest completions from the queries searched for most recently
+    and often, kept in memory, without calling the API.
+
+    Queries are ranked by how many times they've been searched for,
+    with each search counting for half as much after `half_life`
+    seconds. They're only suggested once `min_searches` different
+    clients have searched for them, so no one client can put a query
+    in front of everyone else. Up to `max_queries` of the most popular
+    are kept.
+    """
+
+    def __init__(self, max_queries=10000, half_life=86400, min_searches=2):
+        self.max_queries = max_queries
+        self.half_life = half_life
+        self.min_searches = min_searches
+        # Scores are searches weighted by when they happened, relative
+        # to the epoch, so older searches decay without updating them
+        self.scores = {}
+        # Hashes of the clients searching for each query,
+        # up to `min_searches` of them
+        self.searchers = {}
+        self.queries = []
+        self._epoch = time.time()
+        self._salt = os.urandom(16)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def _weight(self, now):
+        return 2 ** ((now - self._epoch) / self.half_life)
+
+    def _hash_client(self, client):
+        return hashlib.blake2b(
+            client.encode("utf-8"), key=self._salt, digest_size=8
+        ).digest()
+
+    def record(self, query, client=None):
+        """
+        Count a search for `query` by `client`, e.g. its IP address,
+        which is only kept as a salted hash. Without a `client`,
+        each search counts as a different client's.
+        """
+
+        query = normalize_query(query or "")
+
+        if not query:
+            return
+
+        now = time.time()
+        searcher = object() if client is None else self._hash_client(client)
+
+        with self._lock:
+            weight = self._weight(now)
+
+            if weight > MAX_WEIGHT:
+                self.scores = {
+                    item: score / weight for item, score in self.scores.items()
+                }
+                self._epoch = now
+                weight = 1
+
+            if query not in self.scores:
+                bisect.insort(self.queries, query)
+                self.scores[query] = 0
+                self.searchers[query] = set()
+
+            self.scores[query] += weight
+
+            if len(self.searchers[query]) < self.min_searches:
+                self.searchers[query].add(searcher)
+
+            # Prune in batches, rather than on every new query
+            if len(self.queries) > self.max_queries * 1.1:
+                self._prune()
+
+    def _prune(self):
+        kept = heapq.nlargest(
+            self.max_queries, self.scores, key=self.scores.get
+        )
+        self.scores = {query: self.scores[query] for query in kept}
+        self.searchers = {query: self.searchers[query] for query in kept}
+        self.queries = sorted(kept)
+
+    def popularity(self, query):
+        """
+        Return the decayed number of searches for `query`
+        """
+
+        with self._lock:
+            score = self.scores.get(normalize_query(query or ""), 0)
+
+            return score / self._weight(time.time())
+
+    def suggest(self, prefix, limit=10):
+        """
+        Return up to `limit` popular queries starting with `prefix`,
+        most popular first
+        """
+
+        prefix = normalize_query(prefix or "")
+
+        if not prefix:
+            return []
+
+        with self._lock:
+            start = bisect.bisect_left(self.queries, prefix)
+            end = bisect.bisect_left(self.queries, prefix + "\U0010ffff")
+            candidates = [
+                query
+                for query in self.queries[start:end]
+                if len(self.searchers[query]) >= self.min_searches
+            ]
+
+            return heapq.nlargest(limit, candidates, key=self.scores.get)
@@ -0,0 +1,85 @@
+# Standard library
+import time
+from contextlib import contextmanager
+
+# Packages
+import flask
+
+
+class SearchTimer:
+    """
+    Add up the time a search request spends in each phase, e.g.
+    "filter", "upstream" or "render", since it was created
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def record(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def timings(self):
+        """
+        Return the milliseconds spent in each phase, and in total
+        """
+
+        timings = {
+            phase: round(seconds * 1000, 2)
+            for phase, seconds in self.phases.items()
+        }
+        timings["total"] = round(
+            (time.perf_counter() - self.started) * 1000, 2
+        )
+
+        return timings
+
+    def server_timing(self, timings=None):
+        """
+        Format the timings, or `timings` already taken from `timings()`,
+        for a Server-Timing header
+        """
+
+        if timings is None:
+            timings = self.timings()
+
+        return ", ".join(
+            f"{phase};dur={milliseconds}"
+            for phase, milliseconds in timings.items()
+        )
+
+
+def start_timer():
+    """
+    Time the phases of the current request,
+    in a `SearchTimer` kept in `flask.g`
+    """
+
+    timer = flask.g.search_timer = SearchTimer()
+
+    return timer
+
+
+def record_since(phase, started):
+    """
+    Record the time since `started` (from `time.perf_counter`) against
+    `phase` of the current request, if it is being timed
+    """
+
+    if flask.has_app_context() and "search_timer" in flask.g:
+        flask.g.search_timer.record(phase, time.perf_counter() - started)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Record the time spent in the block, or function, against `phase`
+    of the current request, if it is being timed
+    """
+
+    started = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        record_since(phase, started)
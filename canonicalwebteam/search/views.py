@@ -1,30 +1,452 @@
 # Standard library
+import asyncio
+import hashlib
+import logging
 import os
+import threading
+import time
+from contextlib import asynccontextmanager
 
 # Packages
 import flask
+import requests
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.http import quote_etag
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 # Local
-from canonicalwebteam.search.models import get_search_results
+from canonicalwebteam.search.batch import (
+    MAX_NUM,
+    async_get_merged_search_results,
+    get_merged_search_results,
+    read_searches,
+    warm_search_cache,
+)
+from canonicalwebteam.search.budget import (
+    CallBudget,
+    QuotaExceededError,
+    QuotaTracker,
+)
+from canonicalwebteam.search.cache import build_cache_key
+from canonicalwebteam.search.models import (
+    async_get_search_results,
+    block_unwanted_searches,
+    get_next_page_start,
+    get_search_results,
+    is_quota_error,
+    is_timeout,
+    prefetch_search_results,
+)
+from canonicalwebteam.search.hooks import UpstreamHooks, get_session_hooks
+from canonicalwebteam.search.jsonlib import dumps
+from canonicalwebteam.search.metrics import SearchMetrics
+from canonicalwebteam.search.results import SearchResults, compact_results
+from canonicalwebteam.search.normalize import normalize_search_params
+from canonicalwebteam.search.rules import SearchRulesFile
+from canonicalwebteam.search.session import SearchSession
+from canonicalwebteam.search.singleflight import SingleFlightTimeout
+from canonicalwebteam.search.timing import (
+    record_since,
+    start_timer,
+    timed,
+)
 
 
 class NoAPIKeyError(Exception):
     pass
 
 
+logger = logging.getLogger(__name__)
+
 limiter = Limiter(get_remote_address)
 
+# Longer prefixes than this won't match anything worth suggesting
+MAX_SUGGEST_PREFIX = 100
+
+
+@timed("filter")
+def _parse_search_request(site, rules, max_query_length, metrics):
+    """
+    Read the search parameters from the request, rejecting unwanted
+    searches before any expensive work like rate limiting or rendering
+
+    Returns the parameters as provided, for the template, and in
+    their canonical form, for searching
+    """
+
+    params = flask.request.args
+    query = params.get("q")
+    start = params.get("start")
+    num = params.get("num")
+    site_search = site or params.get("siteSearch") or params.get("domain")
+
+    if query and len(query) > max_query_length:
+        flask.abort(400, "Search query is too long")
+
+    # Search for the canonical form of the query, so equivalent
+    # queries share cache entries, but render the original
+    search_params = normalize_search_params(
+        query, start=start, num=num, siteSearch=site_search
+    )
+
+    if search_params["query"]:
+        block_unwanted_searches(
+            search_params["query"],
+            str(flask.request.user_agent),
+            rules,
+            metrics,
+        )
+
+    return query, start, num, site_search, search_params
+
+
+def _search_fallback_index(fallback_index, search_params, compact):
+    results = fallback_index.search(
+        search_params["query"],
+        start=search_params["start"],
+        num=search_params["num"],
+        site_search=search_params["siteSearch"],
+    )
+
+    if compact:
+        return SearchResults.from_dict(results)
+
+    return results
+
+
+def _render_search(template_path, metrics, **context):
+    started = time.perf_counter()
+    page = flask.render_template(template_path, **context)
+    metrics.observe_render(time.perf_counter() - started)
+    record_since("render", started)
+
+    return page
+
+
+def _digest_results(search_params, results):
+    """
+    Hash the normalized search and its results, to identify a page of
+    results before rendering it
+    """
+
+    if isinstance(results, SearchResults):
+        results = results.to_dict()
+
+    digest = hashlib.sha256(dumps(search_params))
+    digest.update(dumps(results))
+
+    return digest.hexdigest()[:32]
+
+
+def _build_results_headers(search_params, results, cache_headers, etag):
+    """
+    Build the headers for a page of results. Caching headers are only
+    added when there are results, so a failed search isn't cached.
+
+    Returns the headers, and the digest of the results, if needed for
+    an ETag or `page_cache`.
+    """
+
+    headers = {"X-Robots-Tag": "noindex"}
+    digest = None
+
+    if results is not None:
+        headers.update(cache_headers)
+
+        if etag:
+            digest = _digest_results(search_params, results)
+            headers["ETag"] = quote_etag(digest)
+
+    return headers, digest
+
+
+def _is_not_modified(digest):
+    """
+    Whether the client already has the page of results with `digest`,
+    comparing weakly as If-None-Match should (RFC 7232), so it still
+    matches once e.g. compression at the edge makes it W/"..."
+    """
+
+    return digest is not None and flask.request.if_none_match.contains_weak(
+        digest
+    )
+
+
+def _render_results(
+    template_path,
+    metrics,
+    search_params,
+    results,
+    cache_headers,
+    etag,
+    page_cache,
+    **context,
+):
+    """
+    Render a page of results, or reuse the page from `page_cache`
+
+    Returns an empty 304 if the client has the page already.
+    """
+
+    headers, digest = _build_results_headers(
+        search_params, results, cache_headers, etag
+    )
+
+    if _is_not_modified(digest):
+        return "", 304, headers
+
+    if page_cache is None or results is None:
+        page = _render_search(
+            template_path, metrics, results=results, **context
+        )
+
+        return page, headers
+
+    # Key on the context as the template receives it, as the query
+    # is shown as typed, and on the results, so new results are
+    # rendered afresh
+    page_key = build_cache_key(
+        template_path,
+        dict(
+            context,
+            results=digest or _digest_results(search_params, results),
+        ),
+        prefix="canonicalwebteam.search.page",
+    )
+    page = page_cache.get(page_key)
+
+    if page is None:
+        page = page_cache.set(
+            page_key,
+            _render_search(template_path, metrics, results=results, **context),
+        )
+
+    return page, headers
+
+
+def _respond_with_json(search_params, results, cache_headers, etag, query):
+    """
+    Return the query and just the fields of the results needed to show
+    them, without rendering a template
+
+    Returns an empty 304 if the client has the results already.
+    """
+
+    headers, digest = _build_results_headers(
+        search_params, results, cache_headers, etag
+    )
+
+    if _is_not_modified(digest):
+        return "", 304, headers
+
+    if results is None:
+        results = {}
+    elif isinstance(results, SearchResults):
+        results = results.to_dict()
+
+    with timed("render"):
+        body = dumps({"query": query, **compact_results(results)})
+
+    return flask.Response(body, headers=headers, mimetype="application/json")
+
+
+def _get_cache_headers(cache_control, surrogate_control):
+    headers = {}
+
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+
+    if surrogate_control:
+        headers["Surrogate-Control"] = surrogate_control
+
+    return headers
+
+
+def _add_server_timing():
+    """
+    Time the phases of this request, and add them to the response in
+    a Server-Timing header, and to the log
+    """
+
+    timer = start_timer()
+
+    @flask.after_this_request
+    def add_timings(response):
+        timings = timer.timings()
+        server_timing = timer.server_timing(timings)
+
+        response.headers["Server-Timing"] = server_timing
+        logger.info(
+            f"Search timings: {server_timing}",
+            extra={"search_timings": timings},
+        )
+
+        return response
+
+
+def _observe_upstream(upstream_hooks, metrics):
+    """
+    Record responses from the API in `metrics`, once for each response
+    however many views with the same metrics share the session or client
+    """
+
+    upstream_hooks.add(("metrics", id(metrics)), metrics.observe_upstream)
+
+
+def _track_quota(upstream_hooks, quota, quota_limit):
+    """
+    Count calls to the API against `quota`, once for each call however
+    many views with the same quota share the session or client
+    """
+
+    upstream_hooks.add(
+        ("quota", quota.name, quota_limit),
+        lambda status, seconds: quota.record(limiter.limiter),
+    )
+
+
+def _is_quota_exhausted(quota):
+    """
+    Whether to stop calling the API, as `quota` is nearly used up
+    """
+
+    if quota is None or not quota.is_exhausted(limiter.limiter):
+        return False
+
+    logger.warning("Search quota nearly used up: serving without the API")
+
+    return True
+
+
+def _record_query(suggestions, search_params, results):
+    """
+    Count a search in `suggestions` if it found something, once per
+    search rather than for every page of results, by the client's IP
+    address, as for rate limiting
+    """
+
+    if suggestions is None or search_params["start"]:
+        return
+
+    if isinstance(results, SearchResults):
+        entries = results.entries
+    else:
+        entries = results.get("entries")
+
+    if entries:
+        suggestions.record(search_params["query"], get_remote_address())
+
+
+def _is_merged_search(search_params):
+    """
+    Whether more results were asked for than the API returns at once
+    """
+
+    return bool(search_params["num"]) and int(search_params["num"]) > MAX_NUM
+
+
+def _prefetch_next_page(results, **kwargs):
+    """
+    Fetch the page after `results` into the cache in the background,
+    if there is one
+    """
+
+    next_page_start = get_next_page_start(results)
+
+    if next_page_start:
+        prefetch_search_results(start=str(next_page_start), **kwargs)
+
+
+def _start_warming(searches, site, **kwargs):
+    """
+    Warm the cache with `searches` in a background thread,
+    searching `site` unless they say otherwise
+    """
+
+    # API key should always be provided as an environment variable
+    search_api_key = os.getenv("SEARCH_API_KEY")
+
+    if not search_api_key:
+        logger.warning("Unable to warm search cache: No API key provided")
+        return None
+
+    if isinstance(searches, (str, os.PathLike)):
+        searches = read_searches(searches)
+
+    searches = [
+        {"query": search} if isinstance(search, str) else search
+        for search in searches
+    ]
+
+    if site:
+        searches = [{"siteSearch": site, **search} for search in searches]
+
+    thread = threading.Thread(
+        target=warm_search_cache,
+        kwargs=dict(kwargs, api_key=search_api_key, searches=searches),
+        name="search-warm",
+        daemon=True,
+    )
+    thread.start()
+
+    return thread
+
+
+def _check_output(output):
+    if output not in ("html", "json"):
+        raise ValueError(f"Unknown search view output: {output}")
+
+
+def _check_stale(cache, stale_while_revalidate, stale_if_error):
+    # Without a stale_ttl, expired results are gone, so never served
+    if (
+        (stale_while_revalidate or stale_if_error)
+        and cache is not None
+        and not cache.stale_ttl
+    ):
+        raise ValueError(
+            "Serving stale results needs a cache with a stale_ttl, "
+            "e.g. SearchCache(ttl=600, stale_ttl=86400)"
+        )
+
 
 def build_search_view(
     app,
-    session,
+    session=None,
     site=None,
     template_path="search.html",
     search_engine_id="009048213575199080868:i3zoqdwqk8o",
     site_restricted_search=False,
     request_limit="2000/day;100/minute;2/second",
+    cache=None,
+    single_flight=None,
+    stale_while_revalidate=False,
+    stale_if_error=False,
+    rules=None,
+    max_query_length=2048,
+    compact=False,
+    timeout=None,
+    prefetch=False,
+    prefetch_limit="1000/day",
+    fallback_index=None,
+    quota_limit=None,
+    quota_threshold=0.9,
+    metrics=None,
+    server_timing=False,
+    cache_control=None,
+    surrogate_control=None,
+    etag=False,
+    page_cache=None,
+    output="html",
+    suggestions=None,
+    warm_searches=None,
+    warm_limit="1000/day",
+    warm_concurrency=4,
 ):
     """
     Build and return a view function that will query the
@@ -47,55 +469,613 @@ def build_search_view(
                 template_path="search.html"
             )
         )
+
+    If no `session` is provided, a `SearchSession` is created, with a
+    connection pool, timeouts and retries suited to the API.
+
+    Pass a `SearchCache` as `cache` to reuse results for repeated
+    queries instead of calling the API every time, and a `SingleFlight`
+    as `single_flight` to share one API call between concurrent
+    identical searches.
+
+    With a cache, `stale_while_revalidate` serves expired results
+    immediately while refreshing them in the background, and
+    `stale_if_error` serves them when the API returns a 5xx or 429
+    error. Expired results are kept for the cache's `stale_ttl`, which
+    must be set to use either, or ValueError is raised.
+
+    To change which searches are blocked, pass `SearchRules` as `rules`,
+    or the path to a JSON rules file, which is reloaded when it changes.
+    Blocked searches, and queries longer than `max_query_length`, are
+    rejected before rate limiting or calling the API.
+
+    With `compact`, the template gets a `SearchResults` object with
+    only the fields needed to render results, rather than the full
+    API response, to save memory and cache space.
+
+    `timeout` is the most seconds a search may spend waiting for the
+    API, from connecting to reading the whole response. Past it, the
+    page is rendered with stale cached results if there are any, or
+    without results.
+
+    With a cache, `prefetch` fetches the next page of results into the
+    cache in the background after serving each page, up to
+    `prefetch_limit` extra calls to the API.
+
+    If `num` is over 10, the API's limit, the pages of 10 needed are
+    fetched at once and merged into one set of results.
+
+    When we run out of API quota, results are taken from
+    `fallback_index`, a `LocalSearchIndex`, if provided. If the index
+    is learning, results from the API are added to it as they're seen.
+
+    Set `quota_limit` to our API quota, e.g. "10000/day", to count every
+    call the `session` makes to the API, across all workers sharing the
+    rate limiter's storage. Once `quota_threshold` of it is used,
+    searches are only served from the cache, or else `fallback_index`,
+    until the quota resets.
+
+    Pass `PrometheusMetrics`, or another `SearchMetrics`, as `metrics`
+    to measure how long searches take, and count why they're rejected.
+
+    With `server_timing`, each response has a Server-Timing header,
+    and a log line, breaking down how long was spent filtering, rate
+    limiting, calling the API, decoding and processing its response,
+    and rendering.
+
+    Pages of results are sent with `cache_control` and
+    `surrogate_control` as their Cache-Control and Surrogate-Control
+    headers, if set, so browsers and CDNs can cache them. With `etag`,
+    they also get an ETag from the search and its results, and
+    requests with a matching If-None-Match get a 304, without
+    rendering the page.
+
+    Pass a `PageCache` as `page_cache` to reuse rendered pages of
+    results rather than rendering the template again. Only use it with
+    templates which depend on nothing but the search and its results.
+
+    With `output="json"`, rather than rendering `template_path`, the
+    view returns the query and the fields of the results needed to show
+    them as JSON, e.g. for a typeahead. See `build_search_api_view`.
+
+    Pass `QuerySuggestions` as `suggestions` to count each search that
+    finds results, to suggest from with `build_suggest_view`.
+
+    With a cache, `warm_searches` - a list of popular queries or search
+    specs, or the path to a file of them - are fetched into the cache
+    in the background when the view is built, `warm_concurrency` at a
+    time, up to `warm_limit` calls to the API, and stopping if the
+    quota is nearly used up. See `warm_search_cache`.
     """
 
+    _check_output(output)
+    _check_stale(cache, stale_while_revalidate, stale_if_error)
+
+    if isinstance(rules, (str, os.PathLike)):
+        rules = SearchRulesFile(rules)
+
+    if session is None:
+        session = SearchSession()
+
+    prefetch_budget = CallBudget(prefetch_limit, "prefetch")
+    quota = None
+    cache_headers = _get_cache_headers(cache_control, surrogate_control)
+
+    if metrics is None:
+        metrics = SearchMetrics()
+    else:
+        _observe_upstream(get_session_hooks(session), metrics)
+
+    if cache is not None:
+        metrics.watch_cache(cache)
+
+    if quota_limit:
+        quota = QuotaTracker(quota_limit, quota_threshold)
+        _track_quota(get_session_hooks(session), quota, quota_limit)
+
     limiter.init_app(app)
 
+    if warm_searches and cache is not None:
+        warm_budget = CallBudget(warm_limit, "warm")
+
+        def warm_budget_allows():
+            if quota is not None and quota.is_exhausted(limiter.limiter):
+                return False
+
+            return warm_budget.consume(limiter.limiter)
+
+        _start_warming(
+            session=session,
+            searches=warm_searches,
+            site=site,
+            search_engine_id=search_engine_id,
+            site_restricted_search=site_restricted_search,
+            cache=cache,
+            compact=compact,
+            timeout=timeout,
+            max_workers=warm_concurrency,
+            budget=warm_budget_allows,
+        )
+
     def search_view():
         """
         Get search results from Google Custom Search
         """
+        started = time.perf_counter()
+
+        if server_timing:
+            _add_server_timing()
+
+        try:
+            return serve_search()
+        finally:
+            metrics.observe_request(time.perf_counter() - started)
+
+    def serve_search():
+        query, start, num, site_search, search_params = _parse_search_request(
+            site, rules, max_query_length, metrics
+        )
+        results = None
+
         # API key should always be provided as an environment variable
         search_api_key = os.getenv("SEARCH_API_KEY")
 
         if not search_api_key:
             raise NoAPIKeyError("Unable to search: No API key provided")
 
-        params = flask.request.args
-        query = params.get("q")
-        start = params.get("start")
-        num = params.get("num")
-        site_search = site or params.get("siteSearch") or params.get("domain")
-        results = None
+        if search_params["query"]:
+            merged_search = _is_merged_search(search_params)
+            cache_only = _is_quota_exhausted(quota)
+            # Whether the results are the API's, rather than the index's
+            from_api = False
+            search = (
+                get_merged_search_results
+                if merged_search
+                else get_search_results
+            )
+
+            rate_limit_started = time.perf_counter()
+
+            with limiter.limit(
+                request_limit,
+                on_breach=lambda request_limit: metrics.record_rate_limited(),
+            ):
+                record_since("ratelimit", rate_limit_started)
+
+                try:
+                    results = search(
+                        session=session,
+                        api_key=search_api_key,
+                        search_engine_id=search_engine_id,
+                        site_restricted_search=site_restricted_search,
+                        cache=cache,
+                        single_flight=single_flight,
+                        stale_while_revalidate=stale_while_revalidate,
+                        stale_if_error=stale_if_error,
+                        rules=rules,
+                        compact=compact,
+                        timeout=timeout,
+                        cache_only=cache_only,
+                        **search_params,
+                    )
+                    from_api = True
+
+                    if fallback_index is not None and fallback_index.learn:
+                        fallback_index.add_results(results)
+
+                    _record_query(suggestions, search_params, results)
+                except QuotaExceededError:
+                    if fallback_index is not None:
+                        results = _search_fallback_index(
+                            fallback_index, search_params, compact
+                        )
+                except (
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ConnectionError,
+                    SingleFlightTimeout,
+                ) as error:
+                    if not is_timeout(error):
+                        raise
 
-        if query:
-            with limiter.limit(request_limit):
-                results = get_search_results(
+                    logger.warning(f"Search timed out: {type(error).__name__}")
+                except requests.exceptions.HTTPError as error:
+                    if fallback_index is None or not is_quota_error(error):
+                        raise
+
+                    results = _search_fallback_index(
+                        fallback_index, search_params, compact
+                    )
+
+            # Only prefetch while the API is serving us, so not after
+            # falling back on the index when out of quota
+            if (
+                prefetch
+                and cache is not None
+                and results
+                and from_api
+                and not merged_search
+                and not cache_only
+            ):
+                _prefetch_next_page(
+                    results,
                     session=session,
                     api_key=search_api_key,
                     search_engine_id=search_engine_id,
-                    siteSearch=site_search,
                     site_restricted_search=site_restricted_search,
-                    query=query,
-                    start=start,
-                    num=num,
+                    cache=cache,
+                    num=search_params["num"],
+                    siteSearch=search_params["siteSearch"],
+                    query=search_params["query"],
+                    compact=compact,
+                    timeout=timeout,
+                    budget=lambda: prefetch_budget.consume(limiter.limiter),
+                )
+
+            if output == "json":
+                return _respond_with_json(
+                    search_params, results, cache_headers, etag, query
+                )
+
+            return _render_results(
+                template_path,
+                metrics,
+                search_params,
+                results,
+                cache_headers,
+                etag,
+                page_cache,
+                query=query,
+                start=start,
+                num=num,
+                siteSearch=site_search,
+            )
+
+        elif output == "json":
+            return _respond_with_json(search_params, None, {}, False, query)
+
+        else:
+            return _render_search(
+                template_path,
+                metrics,
+                query=query,
+                start=start,
+                num=num,
+                results=results,
+                siteSearch=site_search,
+            )
+
+    return search_view
+
+
+def build_search_api_view(app, **options):
+    """
+    Build and return a view function which returns search results as
+    JSON, for searching from the browser without rendering a template:
+
+        app.add_url_rule(
+            "/search.json",
+            "search-json",
+            build_search_api_view(app, session=session, cache=cache),
+        )
+
+    It takes the same options as `build_search_view`, so it filters
+    bots, rate limits and caches searches in the same way. Pass it the
+    same `cache` and `compact` as the HTML view to share results with
+    it. The response looks like:
+
+        {
+            "query": "snap",
+            "entries": [{"title": ..., "link": ..., ...}, ...],
+            "queries": {"request": [...], "nextPage": [...]},
+            "searchInformation": {"totalResults": "52", ...}
+        }
+    """
+
+    return build_search_view(app, output="json", **options)
+
+
+def build_suggest_view(
+    app,
+    suggestions,
+    request_limit="600/minute;20/second",
+    limit=10,
+):
+    """
+    Build and return a view function which suggests popular queries
+    starting with the "q" parameter, as JSON, from `QuerySuggestions`
+    counting the searches served by other views, without calling
+    the API:
+
+        suggestions = QuerySuggestions()
+
+        app.add_url_rule(
+            "/search",
+            "search",
+            build_search_view(app, suggestions=suggestions),
+        )
+        app.add_url_rule(
+            "/search/suggest",
+            "search-suggest",
+            build_suggest_view(app, suggestions),
+        )
+
+    Returns up to `limit` suggestions, most popular first, e.g.:
+
+        {"query": "sn", "suggestions": ["snap", "snapcraft"]}
+    """
+
+    limiter.init_app(app)
+
+    def suggest_view():
+        """
+        Suggest popular queries
+        """
+
+        query = flask.request.args.get("q", "")[:MAX_SUGGEST_PREFIX]
+
+        with limiter.limit(request_limit):
+            body = dumps(
+                {
+                    "query": query,
+                    "suggestions": suggestions.suggest(query, limit),
+                }
+            )
+
+        return flask.Response(
+            body,
+            headers={"X-Robots-Tag": "noindex"},
+            mimetype="application/json",
+        )
+
+    return suggest_view
+
+
+class _LoopClients:
+    """
+    An httpx client for each event loop, shared by the requests running
+    on it, and closed once none are.
+
+    Flask runs each async view in a new event loop, so there each
+    request has a client of its own, closed at the end of it.
+    """
+
+    def __init__(self, create_client):
+        self.create_client = create_client
+        # Each loop's client, and the number of requests using it
+        self.clients = {}
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def client(self):
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            if loop not in self.clients:
+                self.clients[loop] = [self.create_client(), 0]
+
+            entry = self.clients[loop]
+            entry[1] += 1
+
+        try:
+            yield entry[0]
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                unused = entry[1] == 0
+
+                if unused:
+                    del self.clients[loop]
+
+            if unused:
+                await entry[0].aclose()
+
+
+def build_async_search_view(
+    app,
+    site=None,
+    template_path="search.html",
+    search_engine_id="009048213575199080868:i3zoqdwqk8o",
+    site_restricted_search=False,
+    request_limit="2000/day;100/minute;2/second",
+    cache=None,
+    single_flight=None,
+    stale_if_error=False,
+    max_connections=100,
+    rules=None,
+    max_query_length=2048,
+    compact=False,
+    timeout=None,
+    fallback_index=None,
+    quota_limit=None,
+    quota_threshold=0.9,
+    metrics=None,
+    server_timing=False,
+    cache_control=None,
+    surrogate_control=None,
+    etag=False,
+    page_cache=None,
+    output="html",
+    suggestions=None,
+):
+    """
+    Build and return an async view function, like `build_search_view`,
+    which queries the API with httpx, fetching the pages of merged
+    searches concurrently.
+
+    Requires httpx (`pip3 install canonicalwebteam.search[async]`),
+    and Flask's async support (`pip3 install flask[async]`):
+
+        app.add_url_rule(
+            "/search",
+            "search",
+            build_async_search_view(app, site="snapcraft.io"),
+        )
+
+    Flask still runs each async view in a worker thread, in an event
+    loop of its own, so this doesn't let a worker serve more searches
+    at once. Requests in flight on the same event loop share an
+    `httpx.AsyncClient`, with up to `max_connections`, and calls
+    coalesced by an `AsyncSingleFlight` as `single_flight`. Under
+    Flask, that's only the request itself.
+
+    With `quota_limit`, calls made by the client count against our
+    quota, and with `metrics` and `server_timing`, searches are
+    measured, `cache_control`, `surrogate_control` and `etag` set
+    caching headers, `page_cache` keeps rendered pages, and
+    `output="json"` returns JSON, and `suggestions` counts searches,
+    as in `build_search_view`.
+
+    It doesn't take `stale_while_revalidate`, `prefetch` or `warm_*`,
+    which need a background thread to search in.
+    """
+
+    _check_output(output)
+    _check_stale(cache, False, stale_if_error)
+
+    if isinstance(rules, (str, os.PathLike)):
+        rules = SearchRulesFile(rules)
+
+    if httpx is None:
+        raise ImportError(
+            "build_async_search_view requires httpx: "
+            "pip3 install canonicalwebteam.search[async]"
+        )
+
+    limiter.init_app(app)
+
+    quota = None
+    cache_headers = _get_cache_headers(cache_control, surrogate_control)
+    upstream_hooks = UpstreamHooks()
+
+    if metrics is None:
+        metrics = SearchMetrics()
+    else:
+        _observe_upstream(upstream_hooks, metrics)
+
+    if cache is not None:
+        metrics.watch_cache(cache)
+
+    if quota_limit:
+        quota = QuotaTracker(quota_limit, quota_threshold)
+        _track_quota(upstream_hooks, quota, quota_limit)
+
+    clients = _LoopClients(
+        lambda: httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            event_hooks=upstream_hooks.event_hooks(),
+        )
+    )
+
+    async def search_view():
+        """
+        Get search results from Google Custom Search
+        """
+        started = time.perf_counter()
+
+        if server_timing:
+            _add_server_timing()
+
+        try:
+            return await serve_search()
+        finally:
+            metrics.observe_request(time.perf_counter() - started)
+
+    async def serve_search():
+        query, start, num, site_search, search_params = _parse_search_request(
+            site, rules, max_query_length, metrics
+        )
+        results = None
+
+        # API key should always be provided as an environment variable
+        search_api_key = os.getenv("SEARCH_API_KEY")
+
+        if not search_api_key:
+            raise NoAPIKeyError("Unable to search: No API key provided")
+
+        if search_params["query"]:
+            search = (
+                async_get_merged_search_results
+                if _is_merged_search(search_params)
+                else async_get_search_results
+            )
+            cache_only = _is_quota_exhausted(quota)
+
+            rate_limit_started = time.perf_counter()
+
+            with limiter.limit(
+                request_limit,
+                on_breach=lambda request_limit: metrics.record_rate_limited(),
+            ):
+                record_since("ratelimit", rate_limit_started)
+
+                try:
+                    async with clients.client() as client:
+                        results = await search(
+                            client=client,
+                            api_key=search_api_key,
+                            search_engine_id=search_engine_id,
+                            site_restricted_search=site_restricted_search,
+                            cache=cache,
+                            single_flight=single_flight,
+                            stale_if_error=stale_if_error,
+                            rules=rules,
+                            compact=compact,
+                            timeout=timeout,
+                            cache_only=cache_only,
+                            **search_params,
+                        )
+                    if fallback_index is not None and fallback_index.learn:
+                        fallback_index.add_results(results)
+
+                    _record_query(suggestions, search_params, results)
+                except QuotaExceededError:
+                    if fallback_index is not None:
+                        results = _search_fallback_index(
+                            fallback_index, search_params, compact
+                        )
+                except (
+                    httpx.TimeoutException,
+                    SingleFlightTimeout,
+                    asyncio.TimeoutError,
+                ) as error:
+                    logger.warning(f"Search timed out: {type(error).__name__}")
+                except httpx.HTTPStatusError as error:
+                    if fallback_index is None or not is_quota_error(error):
+                        raise
+
+                    results = _search_fallback_index(
+                        fallback_index, search_params, compact
+                    )
+
+            if output == "json":
+                return _respond_with_json(
+                    search_params, results, cache_headers, etag, query
                 )
 
-            return (
-                flask.render_template(
-                    template_path,
-                    query=query,
-                    start=start,
-                    num=num,
-                    results=results,
-                    siteSearch=site_search,
-                ),
-                {"X-Robots-Tag": "noindex"},
+            return _render_results(
+                template_path,
+                metrics,
+                search_params,
+                results,
+                cache_headers,
+                etag,
+                page_cache,
+                query=query,
+                start=start,
+                num=num,
+                siteSearch=site_search,
             )
 
+        elif output == "json":
+            return _respond_with_json(search_params, None, {}, False, query)
+
         else:
-            return flask.render_template(
+            return _render_search(
                 template_path,
+                metrics,
                 query=query,
                 start=start,
                 num=num,
@@ -4,7 +4,7 @@ from setuptools import setup, find_packages
 
 setup(
     name="canonicalwebteam.search",
-    version="2.1.1",
+    version="2.2.0",
     author="Canonical webteam",
     author_email="webteam@canonical.com",
     url="https://github.com/canonical/canonicalwebteam.search",
@@ -20,5 +20,16 @@ setup(
         "user-agents>=2.0.0",
         "Flask-Limiter>=3.8.0",
     ],
+    extras_require={
+        "async": ["httpx>=0.23.0", "Flask[async]"],
+        "json": ["orjson>=3.0.0"],
+        "metrics": ["prometheus_client>=0.12.0"],
+    },
+    entry_points={
+        "console_scripts": [
+            "canonicalwebteam-search-index="
+            "canonicalwebteam.search.indexer:main",
+        ],
+    },
     tests_require=["httpretty"],
 )
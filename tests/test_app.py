@@ -1,9 +1,12 @@
 # Standard library
 import io
 import os
+import threading
+import time
 import unittest
 import warnings
 from contextlib import redirect_stderr
+from unittest import mock
 
 # Packages
 import flask
@@ -11,13 +14,35 @@ import httpretty
 import requests
 
 # Local
-from canonicalwebteam.search import build_search_view, NoAPIKeyError
+from canonicalwebteam.search import (
+    build_search_api_view,
+    build_search_view,
+    build_suggest_view,
+    LocalSearchIndex,
+    NoAPIKeyError,
+    PageCache,
+    QuerySuggestions,
+    SearchCache,
+)
+from canonicalwebteam.search.budget import QuotaTracker
+from canonicalwebteam.search.models import refreshing_keys
+from canonicalwebteam.search.views import limiter
 from tests.fixtures.search_mock import register_uris
 
-
 this_dir = os.path.dirname(os.path.realpath(__file__))
 
 
+class TimeoutSession(requests.Session):
+    """
+    A session where every request times out
+    """
+
+    def get(self, url, **kwargs):
+        self.timeout = kwargs.get("timeout")
+
+        raise requests.exceptions.ReadTimeout()
+
+
 class TestApp(unittest.TestCase):
     def setUp(self):
         """
@@ -262,6 +287,38 @@ class TestApp(unittest.TestCase):
             search_response.data,
         )
 
+    def test_bots(self):
+        """
+        Check web crawlers can't search
+        """
+
+        search_response = self.client.get(
+            "/search?q=snap", headers={"User-Agent": "curl/8.0"}
+        )
+
+        self.assertEqual(search_response.status_code, 403)
+        self.assertEqual(len(httpretty.latest_requests()), 0)
+
+    def test_reject_before_rate_limit(self):
+        """
+        Check unwanted searches are rejected before rate limiting
+        """
+
+        bot_response = self.client.get(
+            "/server/docs/limited/search?q=packer",
+            headers={"User-Agent": "curl/8.0"},
+        )
+        illegal_response = self.client.get(
+            "/server/docs/limited/search?q=【packer】"
+        )
+        long_response = self.client.get(
+            "/server/docs/limited/search?q=" + "packer" * 1000
+        )
+
+        self.assertEqual(bot_response.status_code, 403)
+        self.assertEqual(illegal_response.status_code, 403)
+        self.assertEqual(long_response.status_code, 400)
+
     def test_rate_limit(self):
         """
         Test rate limits
@@ -271,3 +328,708 @@ class TestApp(unittest.TestCase):
             "/server/docs/limited/search?q=packer&start=20&num=3"
         )
         self.assertEqual(search_response.status_code, 429)
+
+    def test_cached_search(self):
+        """
+        Check repeated searches are served from the cache
+        """
+
+        cache = SearchCache(ttl=60)
+        self.app.add_url_rule(
+            "/cached/search",
+            "cached-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=cache,
+            ),
+        )
+
+        first_response = self.client.get("/cached/search?q=snap")
+        second_response = self.client.get("/cached/search?q=snap")
+
+        self.assertEqual(first_response.data, second_response.data)
+        self.assertIn(b"10 results", second_response.data)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_normalized_query(self):
+        """
+        Check equivalent queries share one upstream call,
+        while the template still gets the original query
+        """
+
+        self.app.add_url_rule(
+            "/normalized/search",
+            "normalized-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                template_path="query.html",
+                request_limit="100/second",
+                cache=SearchCache(ttl=60),
+            ),
+        )
+
+        first_response = self.client.get("/normalized/search?q=Snap")
+        second_response = self.client.get(
+            "/normalized/search?q=%20snap%20%20&start=1"
+        )
+
+        self.assertIn(b"Query: Snap - 10 results", first_response.data)
+        self.assertIn(b"Query:  snap   - 10 results", second_response.data)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        self.assertEqual(httpretty.last_request().querystring["q"], ["snap"])
+
+    def test_stale_results(self):
+        """
+        Check expired results are served while being refreshed,
+        and when the API fails
+        """
+
+        self.app.add_url_rule(
+            "/stale/search",
+            "stale-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=SearchCache(ttl=0, stale_ttl=60),
+                stale_while_revalidate=True,
+            ),
+        )
+        stale_if_error_cache = SearchCache(ttl=0, stale_ttl=60)
+        self.app.add_url_rule(
+            "/stale-if-error/search",
+            "stale-if-error-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=stale_if_error_cache,
+                stale_if_error=True,
+            ),
+        )
+
+        self.client.get("/stale/search?q=snap")
+
+        # Served from the cache, while refreshing in the background
+        stale_response = self.client.get("/stale/search?q=snap")
+
+        while refreshing_keys:
+            time.sleep(0.01)
+
+        self.assertIn(b"10 results", stale_response.data)
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+        # Served from the cache when the API fails
+        self.client.get("/stale-if-error/search?q=snap")
+        httpretty.register_uri(
+            httpretty.GET,
+            (
+                "https://www.googleapis.com/customsearch/v1"
+                "?key=test-api-key&cx=009048213575199080868:i3zoqdwqk8o&q=snap"
+            ),
+            match_querystring=True,
+            status=503,
+        )
+        error_response = self.client.get("/stale-if-error/search?q=snap")
+
+        self.assertEqual(error_response.status_code, 200)
+        self.assertIn(b"10 results", error_response.data)
+        self.assertEqual(stale_if_error_cache.stats()["stale_hits"], 1)
+
+    def test_stale_without_stale_ttl(self):
+        """
+        Check serving stale results needs a cache which keeps them
+        """
+
+        for option in ["stale_while_revalidate", "stale_if_error"]:
+            with self.assertRaises(ValueError):
+                build_search_view(
+                    self.app,
+                    session=requests.Session(),
+                    cache=SearchCache(ttl=60),
+                    **{option: True},
+                )
+
+    def test_compact_results(self):
+        """
+        Check compact results render the same as the full results
+        """
+
+        cache = SearchCache(ttl=60)
+        self.app.add_url_rule(
+            "/compact/search",
+            "compact-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=cache,
+                compact=True,
+            ),
+        )
+
+        compact_response = self.client.get("/compact/search?q=snap&start=20")
+        search_response = self.client.get("/search?q=snap&start=20")
+
+        self.assertEqual(compact_response.data, search_response.data)
+
+        cached_results = next(iter(cache.backend._entries.values()))[1]
+        self.assertNotIn("pagemap", cached_results["results"]["entries"][0])
+
+    def test_timeout(self):
+        """
+        Check timed out searches fall back to stale results,
+        or no results
+        """
+
+        cache = SearchCache(ttl=0, stale_ttl=60)
+        timeout_session = TimeoutSession()
+        self.app.add_url_rule(
+            "/cached/search",
+            "cached-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=cache,
+            ),
+        )
+        self.app.add_url_rule(
+            "/timeout/search",
+            "timeout-search",
+            build_search_view(
+                self.app,
+                session=timeout_session,
+                request_limit="100/second",
+                cache=cache,
+                timeout=1,
+            ),
+        )
+        self.app.add_url_rule(
+            "/uncached/timeout/search",
+            "uncached-timeout-search",
+            build_search_view(
+                self.app,
+                session=timeout_session,
+                request_limit="100/second",
+                timeout=1,
+            ),
+        )
+
+        self.client.get("/cached/search?q=snap")
+        stale_response = self.client.get("/timeout/search?q=snap")
+        empty_response = self.client.get("/uncached/timeout/search?q=snap")
+
+        self.assertEqual(timeout_session.timeout, (1, 1))
+        self.assertEqual(stale_response.status_code, 200)
+        self.assertIn(b"10 results", stale_response.data)
+        self.assertEqual(empty_response.status_code, 200)
+        self.assertIn(b"No results", empty_response.data)
+
+    def test_prefetch(self):
+        """
+        Check the next page is fetched into the cache in the background,
+        within the prefetch limit
+        """
+
+        httpretty.register_uri(
+            httpretty.GET,
+            (
+                "https://www.googleapis.com/customsearch/v1?key=test-api-key"
+                "&cx=009048213575199080868:i3zoqdwqk8o&q=snap&start=11"
+            ),
+            match_querystring=True,
+            body='{"items": [{"htmlTitle": "Page two"}]}',
+        )
+        self.app.add_url_rule(
+            "/prefetch/search",
+            "prefetch-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=SearchCache(ttl=60),
+                prefetch=True,
+                prefetch_limit="1/day",
+            ),
+        )
+
+        cache_check_threads = []
+        is_fresh = SearchCache.is_fresh
+
+        def record_is_fresh(cache, key):
+            cache_check_threads.append(threading.current_thread())
+
+            return is_fresh(cache, key)
+
+        with mock.patch.object(SearchCache, "is_fresh", record_is_fresh):
+            self.client.get("/prefetch/search?q=snap")
+
+            while refreshing_keys:
+                time.sleep(0.01)
+
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+        # The request only queues the prefetch, which does the checks
+        self.assertEqual(len(cache_check_threads), 1)
+        self.assertNotEqual(cache_check_threads[0], threading.current_thread())
+
+        next_page_response = self.client.get(
+            "/prefetch/search?q=snap&start=11"
+        )
+
+        self.assertIn(b"Page two", next_page_response.data)
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    def test_no_prefetch_from_fallback(self):
+        """
+        Check the next page isn't prefetched from the API after falling
+        back on the local index when out of quota
+        """
+
+        fallback_index = LocalSearchIndex(
+            {"link": f"https://snapcraft.io/docs/{page}", "title": "Snap"}
+            for page in range(20)
+        )
+        self.app.add_url_rule(
+            "/prefetch-fallback/search",
+            "prefetch-fallback-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=SearchCache(ttl=60),
+                prefetch=True,
+                fallback_index=fallback_index,
+            ),
+        )
+        httpretty.register_uri(
+            httpretty.GET,
+            (
+                "https://www.googleapis.com/customsearch/v1?key=test-api-key"
+                "&cx=009048213575199080868:i3zoqdwqk8o&q=snap"
+            ),
+            match_querystring=True,
+            status=429,
+        )
+
+        search_response = self.client.get("/prefetch-fallback/search?q=snap")
+
+        while refreshing_keys:
+            time.sleep(0.01)
+
+        self.assertIn(b"Next page offset: 11", search_response.data)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+    def test_merged_results(self):
+        """
+        Check more than 10 results are fetched in pages and merged
+        """
+
+        httpretty.register_uri(
+            httpretty.GET,
+            (
+                "https://www.googleapis.com/customsearch/v1?key=test-api-key"
+                "&cx=009048213575199080868:i3zoqdwqk8o&q=snap&start=11"
+            ),
+            match_querystring=True,
+            body='{"items": [{"link": "https://snapcraft.io/docs/two"}]}',
+        )
+
+        search_response = self.client.get("/search?q=snap&num=20")
+
+        self.assertEqual(search_response.status_code, 200)
+        self.assertIn(b"11 results", search_response.data)
+        self.assertNotIn(b"Next page", search_response.data)
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    def test_quota(self):
+        """
+        Check searches are only served from the cache or the local index
+        once the quota is nearly used up
+        """
+
+        fallback_index = LocalSearchIndex(learn=False)
+        fallback_index.add_document(
+            "https://maas.io/docs", "MAAS docs", "Metal as a service"
+        )
+        self.app.add_url_rule(
+            "/quota/search",
+            "quota-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=SearchCache(ttl=60),
+                fallback_index=fallback_index,
+                quota_limit="4/day",
+                quota_threshold=0.5,
+            ),
+        )
+
+        self.client.get("/quota/search?q=snap")
+        self.client.get("/quota/search?q=snap&start=20")
+
+        cached_response = self.client.get("/quota/search?q=snap")
+        fallback_response = self.client.get("/quota/search?q=maas")
+
+        self.assertIn(b"10 results", cached_response.data)
+        self.assertIn(b"MAAS docs", fallback_response.data)
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    def test_quota_shared_session(self):
+        """
+        Check each call to the API is counted once, however many views
+        share the session, and other requests aren't counted
+        """
+
+        session = requests.Session()
+
+        for name, build in [
+            ("html", build_search_view),
+            ("json", build_search_api_view),
+        ]:
+            self.app.add_url_rule(
+                f"/shared-quota/{name}",
+                f"shared-quota-{name}",
+                build(
+                    self.app,
+                    session=session,
+                    request_limit="100/second",
+                    quota_limit="100/day",
+                ),
+            )
+
+        httpretty.register_uri(
+            httpretty.GET, "https://example.com/other", body="other"
+        )
+
+        self.client.get("/shared-quota/json?q=snap")
+        session.get("https://example.com/other")
+
+        self.assertEqual(
+            QuotaTracker("100/day").usage(limiter.limiter),
+            {"100 per 1 day": 1},
+        )
+
+    def test_server_timing(self):
+        """
+        Check the time spent in each phase is in a Server-Timing header
+        and the log
+        """
+
+        self.app.add_url_rule(
+            "/timed/search",
+            "timed-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                server_timing=True,
+            ),
+        )
+
+        with self.assertLogs("canonicalwebteam.search.views", "INFO") as logs:
+            search_response = self.client.get("/timed/search?q=snap")
+
+        phases = [
+            timing.split(";")[0]
+            for timing in search_response.headers["Server-Timing"].split(", ")
+        ]
+
+        self.assertEqual(search_response.headers["X-Robots-Tag"], "noindex")
+        self.assertEqual(
+            phases,
+            [
+                "filter",
+                "ratelimit",
+                "upstream",
+                "decode",
+                "process",
+                "render",
+                "total",
+            ],
+        )
+        self.assertIn("upstream", logs.records[0].search_timings)
+        self.assertEqual(
+            logs.records[0].getMessage(),
+            "Search timings: " + search_response.headers["Server-Timing"],
+        )
+
+        # Rejected searches are timed too
+        bot_response = self.client.get(
+            "/timed/search?q=snap", headers={"User-Agent": "curl/8"}
+        )
+
+        self.assertEqual(bot_response.status_code, 403)
+        self.assertIn("filter;dur=", bot_response.headers["Server-Timing"])
+        self.assertNotIn("Server-Timing", self.client.get("/search").headers)
+
+    def test_http_caching(self):
+        """
+        Check pages of results can be cached, and revalidated with a 304
+        """
+
+        self.app.add_url_rule(
+            "/http-cached/search",
+            "http-cached-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=SearchCache(ttl=60),
+                cache_control="public, max-age=60",
+                surrogate_control="max-age=600",
+                etag=True,
+            ),
+        )
+
+        search_response = self.client.get("/http-cached/search?q=snap")
+        etag = search_response.headers["ETag"]
+
+        self.assertEqual(
+            search_response.headers["Cache-Control"], "public, max-age=60"
+        )
+        self.assertEqual(
+            search_response.headers["Surrogate-Control"], "max-age=600"
+        )
+
+        # The same search, normalized, has the same ETag
+        not_modified_response = self.client.get(
+            "/http-cached/search?q=SNAP", headers={"If-None-Match": etag}
+        )
+
+        self.assertEqual(not_modified_response.status_code, 304)
+        self.assertEqual(not_modified_response.data, b"")
+        self.assertEqual(not_modified_response.headers["ETag"], etag)
+
+        # An ETag weakened on the way, e.g. by compression, still matches
+        weak_response = self.client.get(
+            "/http-cached/search?q=snap",
+            headers={"If-None-Match": f"W/{etag}"},
+        )
+
+        self.assertEqual(weak_response.status_code, 304)
+
+        other_response = self.client.get(
+            "/http-cached/search?q=snap&start=20",
+            headers={"If-None-Match": etag},
+        )
+
+        self.assertEqual(other_response.status_code, 200)
+        self.assertNotEqual(other_response.headers["ETag"], etag)
+
+    def test_page_cache(self):
+        """
+        Check rendered pages are reused until the results change
+        """
+
+        cache = SearchCache(ttl=60)
+        page_cache = PageCache()
+        self.app.add_url_rule(
+            "/page-cached/search",
+            "page-cached-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=cache,
+                page_cache=page_cache,
+            ),
+        )
+
+        first_response = self.client.get("/page-cached/search?q=snap")
+        second_response = self.client.get("/page-cached/search?q=snap")
+
+        self.assertEqual(first_response.data, second_response.data)
+        self.assertEqual(page_cache.stats()["hits"], 1)
+
+        # The query is rendered as typed
+        self.client.get("/page-cached/search?q=Snap")
+        self.assertEqual(len(page_cache), 2)
+
+        # New results are rendered afresh
+        for key in list(cache.backend._entries):
+            cache.delete(key)
+
+        httpretty.register_uri(
+            httpretty.GET,
+            (
+                "https://www.googleapis.com/customsearch/v1?key=test-api-key"
+                "&cx=009048213575199080868:i3zoqdwqk8o&q=snap"
+            ),
+            match_querystring=True,
+            body='{"items": []}',
+        )
+        new_response = self.client.get("/page-cached/search?q=snap")
+
+        self.assertNotEqual(new_response.data, first_response.data)
+        self.assertEqual(len(page_cache), 3)
+
+    def test_json_results(self):
+        """
+        Check the JSON view returns trimmed results, sharing the cache
+        and filtering with the HTML view
+        """
+
+        cache = SearchCache(ttl=60)
+        self.app.add_url_rule(
+            "/shared/search",
+            "shared-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=cache,
+            ),
+        )
+        self.app.add_url_rule(
+            "/search.json",
+            "search-json",
+            build_search_api_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                cache=cache,
+            ),
+        )
+
+        self.client.get("/shared/search?q=snap")
+        json_response = self.client.get("/search.json?q=snap")
+        results = json_response.get_json()
+
+        self.assertEqual(json_response.mimetype, "application/json")
+        self.assertEqual(results["query"], "snap")
+        self.assertEqual(len(results["entries"]), 10)
+        self.assertNotIn("cacheId", results["entries"][1])
+        self.assertEqual(results["queries"]["nextPage"][0]["startIndex"], 11)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+        bot_response = self.client.get(
+            "/search.json?q=snap", headers={"User-Agent": "curl/8"}
+        )
+
+        self.assertEqual(bot_response.status_code, 403)
+        self.assertEqual(
+            self.client.get("/search.json").get_json()["entries"], []
+        )
+
+    def test_suggest(self):
+        """
+        Check searches which found results are suggested, once enough
+        different clients have searched for them
+        """
+
+        suggestions = QuerySuggestions(min_searches=2)
+        self.app.add_url_rule(
+            "/suggesting/search",
+            "suggesting-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                suggestions=suggestions,
+            ),
+        )
+        self.app.add_url_rule(
+            "/search/suggest",
+            "search-suggest",
+            build_suggest_view(self.app, suggestions),
+        )
+
+        first_client = {"REMOTE_ADDR": "192.0.2.1"}
+        second_client = {"REMOTE_ADDR": "192.0.2.2"}
+
+        self.client.get("/suggesting/search?q=Snap", environ_base=first_client)
+        self.client.get("/suggesting/search?q=snap", environ_base=first_client)
+        self.client.get(
+            "/suggesting/search?q=snap&start=20", environ_base=second_client
+        )
+        one_client_response = self.client.get("/search/suggest?q=SN")
+
+        self.client.get(
+            "/suggesting/search?q=snap", environ_base=second_client
+        )
+        suggest_response = self.client.get("/search/suggest?q=SN")
+
+        self.assertEqual(one_client_response.get_json()["suggestions"], [])
+        self.assertEqual(
+            suggest_response.get_json(),
+            {"query": "SN", "suggestions": ["snap"]},
+        )
+        self.assertAlmostEqual(suggestions.popularity("snap"), 3, places=3)
+        self.assertEqual(len(httpretty.latest_requests()), 4)
+
+    def test_warm_cache(self):
+        """
+        Check popular searches are fetched into the cache at startup
+        """
+
+        cache = SearchCache(ttl=60)
+        self.app.add_url_rule(
+            "/warm/search",
+            "warm-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                site="maas.io/docs",
+                request_limit="100/second",
+                cache=cache,
+                warm_searches=["snap"],
+            ),
+        )
+
+        for thread in threading.enumerate():
+            if thread.name == "search-warm":
+                thread.join()
+
+        search_response = self.client.get("/warm/search?q=snap")
+
+        self.assertIn(b"maas.io/docs", search_response.data)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_fallback_index(self):
+        """
+        Check results come from the local index when we're out of quota
+        """
+
+        self.app.add_url_rule(
+            "/fallback/search",
+            "fallback-search",
+            build_search_view(
+                self.app,
+                session=requests.Session(),
+                request_limit="100/second",
+                fallback_index=LocalSearchIndex(),
+            ),
+        )
+
+        # Learn results from the API
+        self.client.get("/fallback/search?q=snap&start=20")
+
+        httpretty.register_uri(
+            httpretty.GET,
+            (
+                "https://www.googleapis.com/customsearch/v1?key=test-api-key"
+                "&cx=009048213575199080868:i3zoqdwqk8o&q=snap"
+            ),
+            match_querystring=True,
+            status=429,
+        )
+        search_response = self.client.get("/fallback/search?q=snap")
+
+        self.assertEqual(search_response.status_code, 200)
+        self.assertIn(b"10 results", search_response.data)
+        self.assertIn(
+            (
+                b"- https://docs.<b>snap</b>craft.io/ros-applications: "
+                b"ROS applications - <b>Snap</b> documentation"
+            ),
+            search_response.data,
+        )
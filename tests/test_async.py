@@ -0,0 +1,276 @@
+# Standard library
+import asyncio
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+# Packages
+import flask
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Local
+from canonicalwebteam.search import (
+    AsyncSingleFlight,
+    SearchCache,
+    SingleFlightTimeout,
+    async_get_search_results,
+    build_async_search_view,
+)
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class TestAsync(unittest.TestCase):
+    def setUp(self):
+        """
+        Set up a Flask app with an async search view,
+        using a mock transport in place of googleapis.com
+        """
+
+        self.requests = []
+
+        def handler(request):
+            self.requests.append(request)
+
+            return httpx.Response(
+                200,
+                json={
+                    "queries": {"nextPage": [{"startIndex": 11}]},
+                    "items": [
+                        {
+                            "htmlTitle": "<b>Snap</b> documentation",
+                            "htmlFormattedUrl": "https://snapcraft.io/docs",
+                            "htmlSnippet": "Snaps<br>\nare packages",
+                        }
+                    ],
+                },
+            )
+
+        transport = httpx.MockTransport(handler)
+        self.client = httpx.AsyncClient(transport=transport)
+        self.clients = clients = []
+
+        class MockClient(httpx.AsyncClient):
+            def __init__(self, **kwargs):
+                kwargs.setdefault("transport", transport)
+                super().__init__(**kwargs)
+                clients.append(self)
+
+        patcher = mock.patch("httpx.AsyncClient", MockClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        os.environ["SEARCH_API_KEY"] = "test-api-key"
+
+        self.app = flask.Flask(
+            "main", template_folder=f"{this_dir}/fixtures/templates"
+        )
+        self.app.add_url_rule(
+            "/search",
+            "search",
+            build_async_search_view(
+                self.app,
+                request_limit="100/second",
+                cache=SearchCache(ttl=60),
+            ),
+        )
+
+    def test_async_view(self):
+        """
+        Check the async view renders results, and caches them
+        """
+
+        test_client = self.app.test_client()
+        first_response = test_client.get("/search?q=Snap")
+        second_response = test_client.get("/search?q=snap")
+
+        self.assertEqual(first_response.status_code, 200)
+        self.assertIn(b"1 results", first_response.data)
+        self.assertIn(b"Next page offset: 11", first_response.data)
+        self.assertEqual(first_response.data, second_response.data)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.requests[0].url.params["q"], "snap")
+        self.assertNotIn("start", self.requests[0].url.params)
+
+    def test_clients_closed(self):
+        """
+        Check each request's client is closed with it, as Flask runs
+        each request in a new event loop
+        """
+
+        test_client = self.app.test_client()
+        first_response = test_client.get("/search?q=snap")
+        second_response = test_client.get("/search?q=maas")
+
+        self.assertIn(b"1 results", first_response.data)
+        self.assertIn(b"1 results", second_response.data)
+        self.assertEqual(len(self.clients), 2)
+        self.assertTrue(all(client.is_closed for client in self.clients))
+
+    def test_concurrent_searches(self):
+        """
+        Check concurrent identical searches share one request
+        """
+
+        async def search_concurrently():
+            single_flight = AsyncSingleFlight()
+
+            return await asyncio.gather(
+                *(
+                    async_get_search_results(
+                        client=self.client,
+                        api_key="test-api-key",
+                        query="snap",
+                        search_engine_id="xxx",
+                        site_restricted_search=False,
+                        single_flight=single_flight,
+                        user_agent="Mozilla/5.0",
+                    )
+                    for _ in range(10)
+                )
+            )
+
+        results = asyncio.run(search_concurrently())
+
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(len(results), 10)
+        self.assertEqual(
+            results[0]["entries"][0]["htmlSnippet"], "Snapsare packages"
+        )
+
+    def test_single_flight_timeout(self):
+        """
+        Check waiters give up after the timeout
+        """
+
+        async def slow_search():
+            await asyncio.sleep(1)
+
+        async def search():
+            await AsyncSingleFlight(timeout=0.01).do("snap", slow_search)
+
+        with self.assertRaises(SingleFlightTimeout):
+            asyncio.run(search())
+
+    def test_timeout(self):
+        """
+        Check slow searches are cancelled after the timeout
+        """
+
+        async def slow_handler(request):
+            await asyncio.sleep(1)
+
+        slow_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(slow_handler)
+        )
+
+        async def search():
+            await async_get_search_results(
+                client=slow_client,
+                api_key="test-api-key",
+                query="snap",
+                search_engine_id="xxx",
+                site_restricted_search=False,
+                user_agent="Mozilla/5.0",
+                timeout=0.01,
+            )
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(search())
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """
+    An API which takes a moment to respond, so searches overlap
+    """
+
+    def do_GET(self):
+        time.sleep(0.2)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"items": [{"title": "Snap"}]}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class TestAsyncServer(unittest.TestCase):
+    def setUp(self):
+        """
+        Serve the API locally, and send the view's requests to it
+        over real connections
+        """
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        port = self.server.server_port
+        self.clients = clients = []
+
+        class LocalTransport(httpx.AsyncHTTPTransport):
+            async def handle_async_request(self, request):
+                request.url = request.url.copy_with(
+                    scheme="http", host="127.0.0.1", port=port
+                )
+
+                return await super().handle_async_request(request)
+
+        class LocalClient(httpx.AsyncClient):
+            def __init__(self, **kwargs):
+                super().__init__(transport=LocalTransport(), **kwargs)
+                clients.append(self)
+
+        patcher = mock.patch("httpx.AsyncClient", LocalClient)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        os.environ["SEARCH_API_KEY"] = "test-api-key"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_concurrent_requests(self):
+        """
+        Check concurrent identical searches sharing an AsyncSingleFlight
+        all succeed, though Flask runs each in its own event loop, and
+        every client is closed
+        """
+
+        app = flask.Flask(
+            "main", template_folder=f"{this_dir}/fixtures/templates"
+        )
+        app.add_url_rule(
+            "/search",
+            "search",
+            build_async_search_view(
+                app,
+                request_limit="100/second",
+                single_flight=AsyncSingleFlight(),
+            ),
+        )
+
+        def search(_):
+            return app.test_client().get("/search?q=snap")
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            responses = list(executor.map(search, range(8)))
+
+        self.assertEqual(
+            [response.status_code for response in responses], [200] * 8
+        )
+        self.assertIn(b"1 results", responses[-1].data)
+        self.assertEqual(len(self.clients), 8)
+        self.assertTrue(all(client.is_closed for client in self.clients))
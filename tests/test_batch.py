@@ -0,0 +1,200 @@
+# Standard library
+import json
+import os
+import tempfile
+import unittest
+import warnings
+
+# Packages
+import httpretty
+import requests
+
+# Local
+from canonicalwebteam.search import (
+    get_batch_search_results,
+    get_merged_search_results,
+    SearchCache,
+    warm_search_cache,
+)
+from tests.fixtures.search_mock import register_uris
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings(
+            "ignore", category=ResourceWarning, message="unclosed.*"
+        )
+        httpretty.enable()
+        register_uris()
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_batch(self):
+        """
+        Check results come back in order, with errors per search
+        """
+
+        batch = get_batch_search_results(
+            session=requests.Session(),
+            api_key="test-api-key",
+            search_engine_id="009048213575199080868:i3zoqdwqk8o",
+            searches=[
+                {"query": "Snap"},
+                {"query": "snap", "siteSearch": "maas.io/docs"},
+                {"query": "【snap】"},
+                {"query": "snap", "start": 20, "num": 3},
+                {"query": "snap"},
+            ],
+            user_agent="Mozilla/5.0",
+            max_workers=3,
+        )
+
+        self.assertEqual(len(batch), 5)
+        self.assertEqual(len(batch[0].results["entries"]), 10)
+        self.assertIn(
+            "maas.io/docs", batch[1].results["entries"][0]["formattedUrl"]
+        )
+        self.assertEqual(batch[2].error.code, 403)
+        self.assertIsNone(batch[2].results)
+        self.assertEqual(len(batch[3].results["entries"]), 3)
+        self.assertEqual(batch[0].results, batch[4].results)
+
+    def test_site_restricted(self):
+        """
+        Check specs can override shared options
+        """
+
+        batch = get_batch_search_results(
+            session=requests.Session(),
+            api_key="test-api-key",
+            search_engine_id="009048213575199080868:i3zoqdwqk8o",
+            searches=[
+                {
+                    "query": "packer",
+                    "start": 20,
+                    "num": 3,
+                    "site_restricted_search": True,
+                }
+            ],
+            user_agent="Mozilla/5.0",
+        )
+
+        self.assertIsNone(batch[0].error)
+        self.assertEqual(len(batch[0].results["entries"]), 3)
+
+    def test_bots(self):
+        """
+        Check every search is blocked for web crawlers
+        """
+
+        batch = get_batch_search_results(
+            session=requests.Session(),
+            api_key="test-api-key",
+            search_engine_id="009048213575199080868:i3zoqdwqk8o",
+            searches=[{"query": "snap"}, {"query": "packer"}],
+            user_agent="curl/8.0",
+        )
+
+        self.assertEqual(batch[0].error.code, 403)
+        self.assertEqual(batch[1].error.code, 403)
+        self.assertEqual(len(httpretty.latest_requests()), 0)
+
+    def test_merged(self):
+        """
+        Check pages are merged without duplicates, with paging
+        information for the merged page
+        """
+
+        httpretty.register_uri(
+            httpretty.GET,
+            (
+                "https://www.googleapis.com/customsearch/v1?key=test-api-key"
+                "&cx=009048213575199080868:i3zoqdwqk8o&q=snap&start=11"
+            ),
+            match_querystring=True,
+            body=json.dumps(
+                {
+                    "queries": {"nextPage": [{"startIndex": 21}]},
+                    "items": [
+                        {
+                            "link": (
+                                "https://developer.ubuntu.com"
+                                "/core/publish-and-distribute"
+                            )
+                        },
+                        {"link": "https://snapcraft.io/docs/page-two"},
+                    ],
+                }
+            ),
+        )
+
+        results = get_merged_search_results(
+            session=requests.Session(),
+            api_key="test-api-key",
+            query="snap",
+            search_engine_id="009048213575199080868:i3zoqdwqk8o",
+            site_restricted_search=False,
+            num=20,
+            user_agent="Mozilla/5.0",
+        )
+
+        self.assertEqual(len(results["entries"]), 11)
+        self.assertEqual(
+            results["entries"][-1]["link"],
+            "https://snapcraft.io/docs/page-two",
+        )
+        self.assertEqual(
+            results["queries"],
+            {
+                "request": [{"startIndex": 1, "count": 11}],
+                "nextPage": [{"startIndex": 21, "count": 20}],
+            },
+        )
+
+    def test_warm_cache(self):
+        """
+        Check searches are fetched into the cache within the budget,
+        skipping any already fresh there
+        """
+
+        cache = SearchCache(ttl=60)
+        calls = []
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "searches.txt")
+
+            with open(path, "w") as searches_file:
+                searches_file.write(
+                    'snap\n\n{"query": "snap", "siteSearch": "maas.io/docs"}\n'
+                    "SNAP\n"
+                )
+
+            warmed = warm_search_cache(
+                session=requests.Session(),
+                api_key="test-api-key",
+                searches=path,
+                search_engine_id="009048213575199080868:i3zoqdwqk8o",
+                cache=cache,
+                max_workers=1,
+                budget=lambda: calls.append(1) or len(calls) <= 1,
+            )
+
+        self.assertEqual(warmed, 1)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        self.assertEqual(
+            len(
+                get_batch_search_results(
+                    session=requests.Session(),
+                    api_key="test-api-key",
+                    search_engine_id="009048213575199080868:i3zoqdwqk8o",
+                    searches=[{"query": "snap"}],
+                    user_agent="Mozilla/5.0",
+                    cache=cache,
+                )[0].results["entries"]
+            ),
+            10,
+        )
+        self.assertEqual(len(httpretty.latest_requests()), 1)
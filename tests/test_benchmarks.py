@@ -0,0 +1,141 @@
+# Standard library
+import json
+import os
+import timeit
+import unittest
+from unittest import mock
+
+# Packages
+import user_agents
+
+# Local
+from canonicalwebteam.search import jsonlib
+from canonicalwebteam.search.bots import (
+    BOT_CONTAINS,
+    BOT_PREFIXES,
+    BotMatcher,
+)
+from tests.fixtures.search_mock import register_uris
+
+# A mix of browsers and crawlers, repeated as in real traffic
+USER_AGENTS = [
+    (
+        "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:120.0) "
+        "Gecko/20100101 Firefox/120.0"
+    ),
+    (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Mozilla/5.0 (compatible; Googlebot/2.1)",
+    "Mozilla/5.0 (compatible; PetalBot)",
+    "python-requests/2.31.0",
+    "curl/8.0",
+] * 50
+
+# Timings vary too much between machines to check on every run,
+# so they're only compared with SEARCH_BENCHMARKS=1
+run_benchmarks = unittest.skipUnless(
+    os.getenv("SEARCH_BENCHMARKS"), "Set SEARCH_BENCHMARKS=1 to run"
+)
+
+
+def is_bot_without_matcher(user_agent):
+    """
+    Bot detection as it was done inline in get_search_results
+    """
+
+    agent = user_agents.parse(user_agent)
+
+    return (
+        agent.is_bot
+        or agent.ua_string.startswith(BOT_PREFIXES)
+        or any(substr in agent.ua_string for substr in BOT_CONTAINS)
+    )
+
+
+def get_search_payloads():
+    """
+    Return the bodies of the mocked Google Custom Search API responses
+    """
+
+    with mock.patch("httpretty.register_uri") as register_uri:
+        register_uris()
+
+    return [
+        call.kwargs["body"].encode("utf-8")
+        for call in register_uri.call_args_list
+    ]
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_bot_matcher(self):
+        """
+        Check BotMatcher agrees with parsing every user agent
+        """
+
+        matcher = BotMatcher()
+
+        for user_agent in set(USER_AGENTS):
+            self.assertEqual(
+                matcher.is_bot(user_agent), is_bot_without_matcher(user_agent)
+            )
+
+    @run_benchmarks
+    def test_bot_matcher_speed(self):
+        """
+        Compare the time BotMatcher takes to parsing every user agent
+        """
+
+        matcher = BotMatcher()
+        inline_time = timeit.timeit(
+            lambda: [is_bot_without_matcher(ua) for ua in USER_AGENTS],
+            number=1,
+        )
+        matcher_time = timeit.timeit(
+            lambda: [matcher.is_bot(ua) for ua in USER_AGENTS], number=1
+        )
+
+        print(
+            f"\nBot detection for {len(USER_AGENTS)} requests: "
+            f"inline {inline_time * 1000:.2f}ms, "
+            f"BotMatcher {matcher_time * 1000:.2f}ms"
+        )
+        self.assertLess(matcher_time, inline_time)
+
+    def test_json_backend(self):
+        """
+        Check the JSON backend decodes API responses, and encodes them
+        for the cache, like the standard library
+        """
+
+        for payload in get_search_payloads():
+            results = json.loads(payload)
+
+            self.assertEqual(jsonlib.loads(payload), results)
+            self.assertEqual(jsonlib.loads(jsonlib.dumps(results)), results)
+
+    @run_benchmarks
+    @unittest.skipIf(
+        jsonlib.backend == "json", "No faster JSON library installed"
+    )
+    def test_json_backend_speed(self):
+        """
+        Compare the time the JSON backend takes to the standard library
+        """
+
+        payloads = get_search_payloads()
+        stdlib_time = timeit.timeit(
+            lambda: [json.dumps(json.loads(p)) for p in payloads], number=200
+        )
+        backend_time = timeit.timeit(
+            lambda: [jsonlib.dumps(jsonlib.loads(p)) for p in payloads],
+            number=200,
+        )
+
+        print(
+            f"\nJSON round trip of {len(payloads)} API responses x200: "
+            f"json {stdlib_time * 1000:.2f}ms, "
+            f"{jsonlib.backend} {backend_time * 1000:.2f}ms"
+        )
+        self.assertLess(backend_time, stdlib_time)
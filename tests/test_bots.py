@@ -0,0 +1,53 @@
+# Standard library
+import unittest
+
+# Local
+from canonicalwebteam.search.bots import BotMatcher
+
+
+class TestBots(unittest.TestCase):
+    def test_match(self):
+        """
+        Check each kind of rule is matched, and browsers aren't
+        """
+
+        matcher = BotMatcher()
+
+        self.assertEqual(
+            matcher.match("python-requests/2.31.0"), "prefix:python"
+        )
+        self.assertEqual(
+            matcher.match("Mozilla/5.0 (compatible; PetalBot)"),
+            "contains:PetalBot",
+        )
+        self.assertEqual(
+            matcher.match("Mozilla/5.0 (compatible; Googlebot/2.1)"),
+            "user-agents",
+        )
+        self.assertIsNone(
+            matcher.match(
+                "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:120.0) "
+                "Gecko/20100101 Firefox/120.0"
+            )
+        )
+
+    def test_prefixes_only_match_the_start(self):
+        """
+        Check prefix rules don't match in the middle of a user agent
+        """
+
+        matcher = BotMatcher(prefixes=["curl"], contains=[])
+
+        self.assertTrue(matcher.is_bot("curl/8.0"))
+        self.assertFalse(matcher.is_bot("Mozilla/5.0 curl"))
+
+    def test_memoized(self):
+        """
+        Check verdicts are cached per user agent
+        """
+
+        matcher = BotMatcher(cache_size=2)
+        matcher.is_bot("curl/8.0")
+        matcher.is_bot("curl/8.0")
+
+        self.assertEqual(matcher.match.cache_info().hits, 1)
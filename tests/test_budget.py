@@ -0,0 +1,59 @@
+# Standard library
+import unittest
+
+# Packages
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+
+# Local
+from canonicalwebteam.search.budget import CallBudget, QuotaTracker
+
+
+class TestBudget(unittest.TestCase):
+    def test_consume(self):
+        """
+        Check calls are allowed until any limit is reached
+        """
+
+        rate_limiter = FixedWindowRateLimiter(MemoryStorage())
+        budget = CallBudget("3/day;2/minute", "prefetch")
+
+        self.assertTrue(budget.consume(rate_limiter))
+        self.assertTrue(budget.consume(rate_limiter))
+        self.assertFalse(budget.consume(rate_limiter))
+
+        # A different budget is counted separately
+        self.assertTrue(CallBudget("1/day", "other").consume(rate_limiter))
+
+    def test_consume_race(self):
+        """
+        Check a call is only allowed if hitting the limit succeeds,
+        even if testing it passed, as when another worker got there first
+        """
+
+        class RacingRateLimiter(FixedWindowRateLimiter):
+            def test(self, *args, **kwargs):
+                return True
+
+        rate_limiter = RacingRateLimiter(MemoryStorage())
+        budget = CallBudget("2/day", "prefetch")
+
+        self.assertEqual(
+            [budget.consume(rate_limiter) for _ in range(4)],
+            [True, True, False, False],
+        )
+
+    def test_quota(self):
+        """
+        Check the quota is exhausted once calls reach the threshold
+        """
+
+        rate_limiter = FixedWindowRateLimiter(MemoryStorage())
+        quota = QuotaTracker("10/day", threshold=0.2)
+
+        quota.record(rate_limiter)
+        self.assertFalse(quota.is_exhausted(rate_limiter))
+
+        quota.record(rate_limiter)
+        self.assertTrue(quota.is_exhausted(rate_limiter))
+        self.assertEqual(quota.usage(rate_limiter), {"10 per 1 day": 2})
@@ -0,0 +1,130 @@
+# Standard library
+import tempfile
+import time
+import unittest
+
+# Local
+from canonicalwebteam.search.cache import (
+    build_cache_key,
+    FileSystemCacheBackend,
+    LRUCacheBackend,
+    PageCache,
+    RedisCacheBackend,
+    SearchCache,
+)
+
+
+class FakeRedis:
+    """
+    The subset of the redis-py client used by RedisCacheBackend
+    """
+
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+
+class TestCache(unittest.TestCase):
+    def test_cache_key(self):
+        """
+        Check the key ignores the API key, unset params and param order
+        """
+
+        endpoint = "https://www.googleapis.com/customsearch/v1"
+        key = build_cache_key(
+            endpoint, {"key": "secret", "q": "snap", "cx": "1", "num": None}
+        )
+
+        self.assertEqual(
+            key, build_cache_key(endpoint, {"cx": "1", "q": "snap"})
+        )
+        self.assertNotIn("secret", key)
+        self.assertNotEqual(
+            key, build_cache_key(endpoint + "/siterestrict", {"q": "snap"})
+        )
+
+    def test_lru_eviction(self):
+        """
+        Check the least recently used entry is evicted first
+        """
+
+        backend = LRUCacheBackend(max_entries=2)
+        backend.set("a", 1, 60)
+        backend.set("b", 2, 60)
+        backend.get("a")
+        backend.set("c", 3, 60)
+
+        self.assertEqual(backend.get("a"), 1)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(backend.get("c"), 3)
+        self.assertEqual(len(backend), 2)
+
+    def test_ttl(self):
+        """
+        Check entries expire once their TTL has passed
+        """
+
+        backend = LRUCacheBackend()
+        backend.set("a", 1, 0.01)
+        time.sleep(0.02)
+
+        self.assertIsNone(backend.get("a"))
+
+    def test_shared_backends(self):
+        """
+        Check the filesystem and Redis backends round-trip results
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            backends = [FileSystemCacheBackend(directory)]
+            backends.append(RedisCacheBackend(FakeRedis()))
+
+            for backend in backends:
+                backend.set("a", {"entries": [{"link": "x"}]}, 60)
+                self.assertEqual(
+                    backend.get("a"), {"entries": [{"link": "x"}]}
+                )
+                backend.delete("a")
+                self.assertIsNone(backend.get("a"))
+
+    def test_stats(self):
+        """
+        Check hits and misses are counted
+        """
+
+        cache = SearchCache(ttl=60)
+        cache.get("a")
+        cache.set("a", {"entries": []})
+        cache.get("a")
+        cache.get("a")
+
+        self.assertEqual(
+            cache.stats(),
+            {"hits": 2, "stale_hits": 0, "misses": 1, "hit_ratio": 2 / 3},
+        )
+
+    def test_page_cache_eviction(self):
+        """
+        Check pages are evicted once they add up to more than max_bytes
+        """
+
+        page_cache = PageCache(max_bytes=10)
+
+        self.assertEqual(page_cache.set("a", "aaaa"), b"aaaa")
+        page_cache.set("b", "bbbb")
+        page_cache.get("a")
+        page_cache.set("c", "cccc")
+        page_cache.set("huge", "h" * 11)
+
+        self.assertEqual(page_cache.get("a"), b"aaaa")
+        self.assertIsNone(page_cache.get("b"))
+        self.assertIsNone(page_cache.get("huge"))
+        self.assertEqual(page_cache.stats()["bytes"], 8)
@@ -0,0 +1,152 @@
+# Standard library
+import json
+import os
+import tempfile
+import unittest
+
+# Local
+from canonicalwebteam.search.fallback import (
+    LocalSearchIndex,
+    matches_site,
+    tokenize,
+)
+
+DOCUMENTS = [
+    {
+        "link": "https://snapcraft.io/docs/installing-snapd",
+        "title": "Installing snapd",
+        "snippet": "How to install snapd on Ubuntu and other distributions",
+    },
+    {
+        "link": "https://snapcraft.io/docs/snap-confinement",
+        "title": "Snap confinement",
+        "snippet": "Confinement levels for snaps: strict, classic, devmode",
+    },
+    {
+        "link": "https://maas.io/docs/install",
+        "title": "How to install MAAS",
+        "snippet": "Install MAAS from a snap or packages",
+    },
+]
+
+
+class TestFallback(unittest.TestCase):
+    def test_tokenize(self):
+        """
+        Check HTML is stripped and words are normalized
+        """
+
+        self.assertEqual(
+            tokenize("<b>Snap</b> &amp; ＭＡＡＳ docs"),
+            ["snap", "maas", "docs"],
+        )
+
+    def test_search(self):
+        """
+        Check results are ranked, paged and shaped like API results
+        """
+
+        index = LocalSearchIndex(DOCUMENTS)
+        results = index.search("install MAAS")
+
+        self.assertEqual(
+            [entry["link"] for entry in results["entries"]],
+            [
+                "https://maas.io/docs/install",
+                "https://snapcraft.io/docs/installing-snapd",
+            ],
+        )
+        self.assertEqual(results["searchInformation"]["totalResults"], "2")
+        self.assertEqual(
+            results["entries"][0]["htmlFormattedUrl"],
+            "https://maas.io/docs/install",
+        )
+
+        second_page = index.search("install MAAS", start=2, num=1)
+
+        self.assertEqual(len(second_page["entries"]), 1)
+        self.assertEqual(
+            second_page["queries"]["previousPage"][0]["startIndex"], 1
+        )
+        self.assertNotIn("nextPage", second_page["queries"])
+        self.assertEqual(index.search("nothing")["entries"], [])
+
+    def test_site_search(self):
+        """
+        Check results are limited to the site searched, before paging
+        """
+
+        index = LocalSearchIndex(DOCUMENTS)
+
+        for site_search, links in [
+            ("maas.io", ["https://maas.io/docs/install"]),
+            (
+                "snapcraft.io/docs/",
+                ["https://snapcraft.io/docs/installing-snapd"],
+            ),
+            ("ubuntu.com", []),
+        ]:
+            results = index.search("install", site_search=site_search)
+
+            self.assertEqual(
+                [entry["link"] for entry in results["entries"]], links
+            )
+            self.assertEqual(
+                results["searchInformation"]["totalResults"], str(len(links))
+            )
+
+        first_page = index.search("install", num=1, site_search="maas.io")
+
+        self.assertNotIn("nextPage", first_page["queries"])
+        self.assertTrue(matches_site("https://docs.ubuntu.com/", "ubuntu.com"))
+        self.assertFalse(matches_site("https://notubuntu.com/", "ubuntu.com"))
+        self.assertFalse(
+            matches_site("https://ubuntu.com/blog", "ubuntu.com/docs")
+        )
+
+    def test_learn(self):
+        """
+        Check results from the API are added once, up to the limit
+        """
+
+        index = LocalSearchIndex(max_documents=2)
+        index.add_results(
+            {
+                "entries": [
+                    {
+                        "link": "https://snapcraft.io/docs",
+                        "title": "Snap documentation",
+                        "htmlSnippet": "<b>Snaps</b> are packages",
+                    }
+                ]
+                * 2
+            }
+        )
+
+        self.assertEqual(len(index), 1)
+        self.assertEqual(
+            index.search("snaps")["entries"][0]["htmlSnippet"],
+            "<b>Snaps</b> are packages",
+        )
+
+        for document in DOCUMENTS:
+            index.add_document(**document)
+
+        self.assertEqual(len(index), 2)
+
+    def test_from_jsonl(self):
+        """
+        Check documents can be loaded from a JSON lines dump
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "documents.jsonl")
+
+            with open(path, "w") as jsonl_file:
+                for document in DOCUMENTS:
+                    jsonl_file.write(json.dumps(document) + "\n")
+
+            index = LocalSearchIndex.from_jsonl(path, learn=False)
+
+        self.assertEqual(len(index), 3)
+        self.assertFalse(index.learn)
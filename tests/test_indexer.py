@@ -0,0 +1,178 @@
+# Standard library
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+# Local
+from canonicalwebteam.search.fallback import (
+    LocalSearchIndex,
+    MappedSearchIndex,
+)
+from canonicalwebteam.search.indexer import main
+
+PAGES = {
+    "docs/installing-snapd.html": (
+        "<html><head><title>Installing snapd</title>"
+        "<style>.install { color: red }</style></head>"
+        "<body><p>How to install snapd on Ubuntu</p></body></html>"
+    ),
+    "docs/snap-confinement.md": (
+        "---\ntitle: Snap confinement\n---\n"
+        "Confinement levels for snaps: strict, classic, devmode\n"
+    ),
+    "maas/index.md": "# How to install MAAS\n\nInstall MAAS from a snap\n",
+}
+
+
+class TestIndexer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.directory.name, "source")
+        self.output = os.path.join(self.directory.name, "search.index")
+
+        for path, content in PAGES.items():
+            self._write(path, content)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write(self, path, content):
+        path = os.path.join(self.source, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "w") as source_file:
+            source_file.write(content)
+
+    def _build(self, *arguments):
+        output = io.StringIO()
+
+        with redirect_stdout(output):
+            main(
+                [self.source, self.output, "--base-url", "https://ubuntu.com"]
+                + list(arguments)
+            )
+
+        return output.getvalue()
+
+    def test_build_directory(self):
+        """
+        Check HTML and Markdown files are indexed with their titles,
+        linked by path from the base URL
+        """
+
+        self._build()
+        index = MappedSearchIndex(self.output)
+        results = index.search("install")
+
+        self.assertEqual(len(index), 3)
+        self.assertEqual(
+            [entry["title"] for entry in results["entries"]],
+            ["How to install MAAS", "Installing snapd"],
+        )
+        self.assertEqual(
+            results["entries"][1]["link"],
+            "https://ubuntu.com/docs/installing-snapd",
+        )
+        self.assertEqual(
+            index.search("confinement")["entries"][0]["link"],
+            "https://ubuntu.com/docs/snap-confinement",
+        )
+        self.assertEqual(index.search("red")["entries"], [])
+        index.close()
+
+    def test_incremental_build(self):
+        """
+        Check only changed documents are tokenized again
+        """
+
+        self.assertIn("(3 changed)", self._build())
+
+        self._write("maas/index.md", "# MAAS\n\nMetal as a service\n")
+        self.assertIn("(1 changed)", self._build())
+        self.assertIn("(3 changed)", self._build("--full"))
+
+        index = MappedSearchIndex(self.output)
+
+        self.assertEqual(index.search("maas")["entries"][0]["title"], "MAAS")
+        self.assertEqual(
+            index.search("maas")["entries"][0]["link"],
+            "https://ubuntu.com/maas",
+        )
+        index.close()
+
+        # Every link changes with the base URL
+        self.assertIn(
+            "(3 changed)", self._build("--base-url", "https://canonical.com")
+        )
+
+        index = MappedSearchIndex(self.output)
+
+        self.assertEqual(
+            index.search("maas")["entries"][0]["link"],
+            "https://canonical.com/maas",
+        )
+        index.close()
+
+    def test_site_search(self):
+        """
+        Check results are filtered by site without decoding the entries
+        of documents that aren't shown
+        """
+
+        self._build()
+        index = MappedSearchIndex(self.output)
+
+        with mock.patch.object(
+            index, "_read_entry", wraps=index._read_entry
+        ) as read_entry:
+            results = index.search(
+                "install", num=1, site_search="ubuntu.com/docs"
+            )
+
+        self.assertEqual(
+            [entry["link"] for entry in results["entries"]],
+            ["https://ubuntu.com/docs/installing-snapd"],
+        )
+        self.assertEqual(read_entry.call_count, 1)
+        index.close()
+
+    def test_matches_local_index(self):
+        """
+        Check a JSON lines dump ranks and filters by site the same
+        mapped as in memory
+        """
+
+        documents = [
+            {"link": f"https://ubuntu.com/{word}", "title": title}
+            for word, title in [
+                ("a", "Snap store"),
+                ("b", "Snap snap confinement"),
+                ("c", "Ubuntu server"),
+            ]
+        ] + [{"link": "https://snapcraft.io/store", "title": "Snap store"}]
+        self.source = os.path.join(self.directory.name, "documents.jsonl")
+
+        with open(self.source, "w") as jsonl_file:
+            jsonl_file.writelines(json.dumps(doc) + "\n" for doc in documents)
+
+        self._build()
+        index = MappedSearchIndex(self.output)
+
+        for query in ["snap", "ubuntu server", "missing"]:
+            for site_search in [None, "snapcraft.io", "ubuntu.com/b"]:
+                self.assertEqual(
+                    index.search(query, num=2, site_search=site_search),
+                    LocalSearchIndex(documents).search(
+                        query, num=2, site_search=site_search
+                    ),
+                )
+
+        index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
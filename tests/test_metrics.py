@@ -0,0 +1,109 @@
+# Standard library
+import os
+import unittest
+import warnings
+
+# Packages
+import flask
+import httpretty
+import requests
+
+try:
+    from prometheus_client import CollectorRegistry
+except ImportError:
+    CollectorRegistry = None
+
+# Local
+from canonicalwebteam.search import (
+    PrometheusMetrics,
+    SearchCache,
+    build_search_view,
+)
+from tests.fixtures.search_mock import register_uris
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+@unittest.skipIf(CollectorRegistry is None, "prometheus_client not installed")
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings(
+            "ignore", category=ResourceWarning, message="unclosed.*"
+        )
+        warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+        httpretty.enable()
+        register_uris()
+        os.environ["SEARCH_API_KEY"] = "test-api-key"
+
+        self.registry = CollectorRegistry()
+        metrics = PrometheusMetrics(registry=self.registry)
+        self.session = session = requests.Session()
+
+        self.app = flask.Flask(
+            "main", template_folder=f"{this_dir}/fixtures/templates"
+        )
+        self.app.add_url_rule(
+            "/search",
+            "search",
+            build_search_view(
+                self.app,
+                session=session,
+                request_limit="100/second",
+                cache=SearchCache(ttl=60),
+                metrics=metrics,
+            ),
+        )
+        self.app.add_url_rule(
+            "/limited/search",
+            "limited-search",
+            build_search_view(
+                self.app,
+                session=session,
+                request_limit="0/second",
+                metrics=metrics,
+            ),
+        )
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def _value(self, name, **labels):
+        return self.registry.get_sample_value(f"search_{name}", labels)
+
+    def test_metrics(self):
+        """
+        Check searches are timed, and rejections counted, and only
+        calls to the API are observed, once each
+        """
+
+        httpretty.register_uri(
+            httpretty.GET, "https://example.com/other", body="other"
+        )
+
+        self.client.get("/search?q=snap")
+        self.client.get("/search?q=snap")
+        self.client.get("/search?q=snap", headers={"User-Agent": "curl/8"})
+        self.client.get("/search?q=【snap】")
+        self.client.get("/limited/search?q=snap")
+        self.session.get("https://example.com/other")
+
+        self.assertEqual(self._value("request_duration_seconds_count"), 5)
+        self.assertEqual(self._value("render_duration_seconds_count"), 2)
+        self.assertEqual(self._value("upstream_duration_seconds_count"), 1)
+        self.assertEqual(
+            self._value("upstream_responses_total", status="200"), 1
+        )
+        self.assertEqual(self._value("cache_hits_total"), 1)
+        self.assertEqual(self._value("cache_misses_total"), 1)
+        self.assertEqual(
+            self._value("bot_rejections_total", rule="prefix:curl"), 1
+        )
+        self.assertEqual(self._value("illegal_character_rejections_total"), 1)
+        self.assertEqual(self._value("rate_limit_rejections_total"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
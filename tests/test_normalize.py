@@ -0,0 +1,42 @@
+# Standard library
+import unittest
+
+# Local
+from canonicalwebteam.search.normalize import (
+    normalize_query,
+    normalize_search_params,
+)
+
+
+class TestNormalize(unittest.TestCase):
+    def test_normalize_query(self):
+        """
+        Check case, whitespace and Unicode forms are normalized
+        """
+
+        self.assertEqual(normalize_query("Snap"), "snap")
+        self.assertEqual(normalize_query(" snap  "), "snap")
+        self.assertEqual(normalize_query("install\t Ubuntu"), "install ubuntu")
+        self.assertEqual(normalize_query("ｓｎａｐ"), "snap")
+        self.assertEqual(normalize_query(None), "")
+
+    def test_normalize_search_params(self):
+        """
+        Check defaults and invalid numbers are dropped
+        """
+
+        self.assertEqual(
+            normalize_search_params("Snap", start="1", num="10"),
+            {"query": "snap", "start": None, "num": None, "siteSearch": None},
+        )
+        self.assertEqual(
+            normalize_search_params(
+                "snap", start="020", num="x", siteSearch=" maas.io/docs"
+            ),
+            {
+                "query": "snap",
+                "start": "20",
+                "num": None,
+                "siteSearch": "maas.io/docs",
+            },
+        )
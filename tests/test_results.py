@@ -0,0 +1,60 @@
+# Standard library
+import unittest
+
+# Local
+from canonicalwebteam.search.results import SearchResults, compact_results
+
+
+class TestResults(unittest.TestCase):
+    def test_compact_results(self):
+        """
+        Check only rendered fields are kept
+        """
+
+        results = compact_results(
+            {
+                "kind": "customsearch#search",
+                "queries": {
+                    "nextPage": [{"startIndex": 11, "cx": "xxx"}],
+                    "request": [{"startIndex": 1, "count": 10}],
+                },
+                "searchInformation": {
+                    "searchTime": 0.2,
+                    "totalResults": "42",
+                },
+                "entries": [
+                    {
+                        "title": "Snap documentation",
+                        "link": "https://snapcraft.io/docs",
+                        "pagemap": {"metatags": [{"og:type": "website"}]},
+                    }
+                ],
+            }
+        )
+
+        self.assertEqual(
+            results,
+            {
+                "entries": [
+                    {
+                        "title": "Snap documentation",
+                        "link": "https://snapcraft.io/docs",
+                    }
+                ],
+                "queries": {
+                    "request": [{"startIndex": 1, "count": 10}],
+                    "nextPage": [{"startIndex": 11}],
+                },
+                "searchInformation": {"totalResults": "42"},
+            },
+        )
+
+        search_results = SearchResults.from_dict(results)
+
+        self.assertEqual(search_results.entries[0].title, "Snap documentation")
+        self.assertEqual(search_results.entries[0].htmlSnippet, "")
+        self.assertEqual(
+            SearchResults.from_dict(search_results.to_dict()).to_dict(),
+            search_results.to_dict(),
+        )
+        self.assertFalse(hasattr(search_results.entries[0], "__dict__"))
@@ -0,0 +1,56 @@
+# Standard library
+import json
+import os
+import tempfile
+import unittest
+
+# Local
+from canonicalwebteam.search.rules import SearchRules, SearchRulesFile
+
+
+class TestRules(unittest.TestCase):
+    def test_rules(self):
+        """
+        Check custom rules replace the defaults
+        """
+
+        rules = SearchRules(
+            bot_prefixes=["NewCrawler"], illegal_characters=["¤"]
+        )
+
+        self.assertEqual(rules.bot_rule("NewCrawler/1.0"), "prefix:NewCrawler")
+        self.assertIsNone(rules.bot_rule("gh/2.0"))
+        self.assertEqual(rules.illegal_character("snap ¤"), "¤")
+        self.assertIsNone(rules.illegal_character("snap 【"))
+
+    def test_reload(self):
+        """
+        Check rules are reloaded when the file changes,
+        and kept when it becomes invalid
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rules.json")
+
+            with open(path, "w") as rules_file:
+                json.dump({"bot_contains": ["AlphaAgent"]}, rules_file)
+
+            reloading_rules = SearchRulesFile(path, check_interval=0)
+
+            self.assertTrue(reloading_rules.current().bot_rule("AlphaAgent"))
+            self.assertTrue(reloading_rules.current().bot_rule("curl/8.0"))
+
+            with open(path, "w") as rules_file:
+                json.dump({"bot_contains": ["BetaAgent"]}, rules_file)
+
+            os.utime(path, ns=(0, 0))
+
+            self.assertFalse(reloading_rules.current().bot_rule("AlphaAgent"))
+            self.assertTrue(reloading_rules.current().bot_rule("BetaAgent"))
+
+            with open(path, "w") as rules_file:
+                rules_file.write("{")
+
+            os.utime(path, ns=(1, 1))
+
+            self.assertTrue(reloading_rules.current().bot_rule("BetaAgent"))
@@ -0,0 +1,201 @@
+# Standard library
+import os
+import threading
+import time
+import unittest
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Packages
+import flask
+import httpretty
+
+# Local
+from canonicalwebteam.search import build_search_view
+from canonicalwebteam.search.session import SearchSession
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """
+    An API which takes 2 seconds to respond
+    """
+
+    def do_GET(self):
+        time.sleep(2)
+
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b'{"items": []}')
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DripHandler(BaseHTTPRequestHandler):
+    """
+    An API which sends its results a byte every 0.2 seconds
+    """
+
+    def do_GET(self):
+        body = b'{"items": []}'
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        try:
+            for byte in body:
+                self.wfile.write(bytes([byte]))
+                self.wfile.flush()
+                time.sleep(0.2)
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings(
+            "ignore", category=ResourceWarning, message="unclosed.*"
+        )
+        httpretty.enable()
+
+    def tearDown(self):
+        httpretty.disable()
+        httpretty.reset()
+
+    def test_retries(self):
+        """
+        Check 5xx errors are retried
+        """
+
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://www.googleapis.com/customsearch/v1",
+            responses=[
+                httpretty.Response(body="", status=503),
+                httpretty.Response(body='{"items": []}'),
+            ],
+        )
+
+        session = SearchSession(backoff_factor=0)
+        response = session.get("https://www.googleapis.com/customsearch/v1")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(httpretty.latest_requests()), 2)
+
+    def test_no_quota_retries(self):
+        """
+        Check 429s aren't retried, as they mean we're out of quota
+        """
+
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://www.googleapis.com/customsearch/v1",
+            status=429,
+            adding_headers={"Retry-After": "30"},
+        )
+
+        session = SearchSession(backoff_factor=0)
+        response = session.get("https://www.googleapis.com/customsearch/v1")
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+    def test_pool_stats(self):
+        """
+        Check connection pool usage is reported by host
+        """
+
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://www.googleapis.com/customsearch/v1",
+            body='{"items": []}',
+        )
+
+        session = SearchSession(pool_size=20)
+        session.get("https://www.googleapis.com/customsearch/v1")
+        session.get("https://www.googleapis.com/customsearch/v1")
+
+        stats = session.pool_stats()["www.googleapis.com"]
+
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["size"], 20)
+        self.assertEqual(session.timeout, (3.05, 10))
+
+
+class TestSessionTimeout(unittest.TestCase):
+    def setUp(self):
+        warnings.filterwarnings(
+            "ignore", category=ResourceWarning, message="unclosed.*"
+        )
+
+    def _search(self, handler):
+        """
+        Search with the default session and a timeout of half a second,
+        against an API served locally by `handler`
+        """
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        local_url = f"http://127.0.0.1:{server.server_port}"
+
+        class LocalSession(SearchSession):
+            def request(self, method, url, **kwargs):
+                url = url.replace("https://www.googleapis.com", local_url)
+
+                return super().request(method, url, **kwargs)
+
+        app = flask.Flask(
+            "main", template_folder=f"{this_dir}/fixtures/templates"
+        )
+        app.add_url_rule(
+            "/search",
+            "search",
+            build_search_view(
+                app,
+                session=LocalSession(),
+                request_limit="100/second",
+                timeout=0.5,
+            ),
+        )
+        os.environ["SEARCH_API_KEY"] = "test-api-key"
+
+        return app.test_client().get("/search?q=snap")
+
+    def test_view_timeout(self):
+        """
+        Check a search with the default session gives up within its
+        timeout, rather than retrying the read timeout and failing
+        """
+
+        started = time.monotonic()
+        search_response = self._search(SlowHandler)
+
+        self.assertEqual(search_response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_view_deadline(self):
+        """
+        Check a search gives up at its timeout even while the API keeps
+        sending, too slowly for any socket timeout to run out
+        """
+
+        started = time.monotonic()
+        search_response = self._search(DripHandler)
+
+        self.assertEqual(search_response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 1.5)
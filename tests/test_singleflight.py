@@ -0,0 +1,93 @@
+# Standard library
+import threading
+import time
+import unittest
+
+# Local
+from canonicalwebteam.search.singleflight import (
+    SingleFlight,
+    SingleFlightTimeout,
+)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, single_flight, function, count=5, **kwargs):
+        """
+        Call `function` through `single_flight` from `count` threads,
+        returning each thread's result or exception
+        """
+
+        outcomes = []
+        lock = threading.Lock()
+
+        def call():
+            try:
+                outcome = single_flight.do("snap", function, **kwargs)
+            except Exception as error:
+                outcome = error
+
+            with lock:
+                outcomes.append(outcome)
+
+        threads = [threading.Thread(target=call) for _ in range(count)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return outcomes
+
+    def test_coalesce(self):
+        """
+        Check concurrent calls share one result
+        """
+
+        calls = []
+
+        def search():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"entries": []}
+
+        single_flight = SingleFlight()
+        outcomes = self.run_concurrently(single_flight, search)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(outcomes, [{"entries": []}] * 5)
+        self.assertEqual(single_flight.in_flight(), 0)
+
+    def test_error(self):
+        """
+        Check every waiter receives the error
+        """
+
+        def search():
+            time.sleep(0.1)
+            raise ValueError("Upstream error")
+
+        outcomes = self.run_concurrently(SingleFlight(), search)
+
+        self.assertEqual(len(outcomes), 5)
+
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, ValueError)
+
+    def test_timeout(self):
+        """
+        Check waiters give up after the timeout
+        """
+
+        def search():
+            time.sleep(0.2)
+            return {"entries": []}
+
+        outcomes = self.run_concurrently(
+            SingleFlight(), search, count=2, timeout=0.05
+        )
+
+        self.assertIn({"entries": []}, outcomes)
+        self.assertTrue(
+            any(isinstance(o, SingleFlightTimeout) for o in outcomes)
+        )
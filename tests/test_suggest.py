@@ -0,0 +1,78 @@
+# Standard library
+import unittest
+from unittest import mock
+
+# Local
+from canonicalwebteam.search.suggest import QuerySuggestions
+
+
+class TestSuggest(unittest.TestCase):
+    def test_suggest(self):
+        """
+        Check popular queries are suggested for a prefix, most popular
+        first, once searched for often enough
+        """
+
+        suggestions = QuerySuggestions(min_searches=2)
+
+        for query in ["snap", "Snapcraft", "snapcraft ", "snapd", "snap"]:
+            suggestions.record(query)
+
+        suggestions.record("snap")
+        suggestions.record("ubuntu")
+        suggestions.record("ubuntu")
+
+        self.assertEqual(suggestions.suggest("SN"), ["snap", "snapcraft"])
+        self.assertEqual(suggestions.suggest("snap", limit=1), ["snap"])
+        self.assertEqual(suggestions.suggest("u"), ["ubuntu"])
+        self.assertEqual(suggestions.suggest(""), [])
+
+    def test_distinct_clients(self):
+        """
+        Check a query is only suggested once searched for by enough
+        different clients, however often one client searches for it
+        """
+
+        suggestions = QuerySuggestions(min_searches=2)
+
+        for _ in range(5):
+            suggestions.record("spam", client="192.0.2.1")
+
+        suggestions.record("snap", client="192.0.2.1")
+        suggestions.record("snap", client="192.0.2.2")
+
+        self.assertEqual(suggestions.suggest("s"), ["snap"])
+        self.assertNotIn("192.0.2.1", suggestions.searchers["snap"])
+
+    def test_decay(self):
+        """
+        Check older searches count for less, and the least popular
+        queries are dropped
+        """
+
+        suggestions = QuerySuggestions(
+            max_queries=2, half_life=60, min_searches=1
+        )
+
+        with mock.patch("time.time", return_value=suggestions._epoch):
+            for _ in range(3):
+                suggestions.record("snap")
+
+        with mock.patch("time.time", return_value=suggestions._epoch + 120):
+            suggestions.record("snapcraft")
+            suggestions.record("snapcraft")
+
+            self.assertAlmostEqual(suggestions.popularity("snap"), 0.75)
+            self.assertEqual(
+                suggestions.suggest("snap"), ["snapcraft", "snap"]
+            )
+
+            # A new search counts for more than the old ones for "snap"
+            suggestions.record("snapd")
+
+            self.assertEqual(len(suggestions), 2)
+            self.assertEqual(suggestions.suggest("s"), ["snapcraft", "snapd"])
+
+
+if __name__ == "__main__":
+    unittest.main()